@@ -0,0 +1,164 @@
+"""
+Control de admisión por clase de endpoint.
+
+Cada clase (consulta, sugerencias, busqueda, exportacion, carga) tiene un
+número de ranuras de ejecución y de espera. Las ranuras son archivos con
+bloqueos OFD de fcntl (por descriptor abierto, como flock, así que también
+separan hilos del mismo worker): el límite se respeta entre todos los
+workers de gunicorn del mismo host y se libera solo si un proceso muere.
+El estado (/api/admision) se consulta con F_OFD_GETLK, que informa si una
+ranura está tomada sin tomarla, así que observarlo no compite con las
+peticiones. Cuando la cola está llena, o la espera vence, la petición se
+rechaza de inmediato con 503 + Retry-After.
+"""
+
+import fcntl
+import os
+import struct
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import jsonify, make_response
+
+
+class Rechazado(Exception):
+    pass
+
+
+# struct flock de Linux: l_type, l_whence, l_start, l_len, l_pid (+ relleno)
+_FLOCK = 'hhqqi4x'
+
+
+def _bloqueo(tipo):
+    # Todo el archivo; l_pid debe ser 0 con los bloqueos OFD
+    return struct.pack(_FLOCK, tipo, os.SEEK_SET, 0, 0, 0)
+
+
+def _intentar(ruta):
+    fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.fcntl(fd, fcntl.F_OFD_SETLK, _bloqueo(fcntl.F_WRLCK))
+        return fd
+    except (BlockingIOError, PermissionError):
+        os.close(fd)
+        return None
+
+
+def _liberar(fd):
+    fcntl.fcntl(fd, fcntl.F_OFD_SETLK, _bloqueo(fcntl.F_UNLCK))
+    os.close(fd)
+
+
+def _tomada(ruta):
+    """Indica si alguien tiene la ranura, sin intentar tomarla."""
+    try:
+        fd = os.open(ruta, os.O_RDONLY)
+    except FileNotFoundError:
+        return False
+    try:
+        resultado = fcntl.fcntl(fd, fcntl.F_OFD_GETLK, _bloqueo(fcntl.F_WRLCK))
+        return struct.unpack(_FLOCK, resultado)[0] != fcntl.F_UNLCK
+    finally:
+        os.close(fd)
+
+
+class ControlAdmision:
+
+    def __init__(self, carpeta, clases, espera_maxima=10, intervalo_sondeo=0.05):
+        self.carpeta = carpeta
+        self.clases = clases
+        self.espera_maxima = espera_maxima
+        self.intervalo_sondeo = intervalo_sondeo
+        os.makedirs(carpeta, exist_ok=True)
+
+    def _ruta(self, clase, tipo, i):
+        return os.path.join(self.carpeta, f"{clase}.{tipo}.{i}")
+
+    def _tomar(self, clase, tipo, n):
+        for i in range(n):
+            fd = _intentar(self._ruta(clase, tipo, i))
+            if fd is not None:
+                return fd
+        return None
+
+    def _ocupadas(self, clase, tipo, n):
+        return sum(_tomada(self._ruta(clase, tipo, i)) for i in range(n))
+
+    def _contador(self, clase, incremento=0):
+        fd = os.open(os.path.join(self.carpeta, f"{clase}.rechazos"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Leer basta con un bloqueo compartido: no frena a quien suma rechazos
+            fcntl.flock(fd, fcntl.LOCK_EX if incremento else fcntl.LOCK_SH)
+            valor = int(os.read(fd, 32) or 0) + incremento
+            if incremento:
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, str(valor).encode())
+            return valor
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @contextmanager
+    def admitir(self, clase):
+        limites = self.clases[clase]
+        fd = self._tomar(clase, 'ejecucion', limites['concurrencia'])
+
+        if fd is None:
+            espera = self._tomar(clase, 'cola', limites['cola'])
+            if espera is None:
+                self._contador(clase, 1)
+                raise Rechazado(clase)
+            try:
+                limite = time.monotonic() + self.espera_maxima
+                while fd is None and time.monotonic() < limite:
+                    time.sleep(self.intervalo_sondeo)
+                    fd = self._tomar(clase, 'ejecucion', limites['concurrencia'])
+            finally:
+                _liberar(espera)
+
+            if fd is None:
+                self._contador(clase, 1)
+                raise Rechazado(clase)
+
+        try:
+            yield
+        finally:
+            _liberar(fd)
+
+    def estado(self):
+        return {
+            clase: {
+                'concurrencia': limites['concurrencia'],
+                'en_ejecucion': self._ocupadas(clase, 'ejecucion', limites['concurrencia']),
+                'cola': limites['cola'],
+                'en_cola': self._ocupadas(clase, 'cola', limites['cola']),
+                'rechazos': self._contador(clase),
+            }
+            for clase, limites in self.clases.items()
+        }
+
+
+def limitar(control, clase, retry_after=5):
+    """
+    Decorador de rutas. `clase` puede ser un nombre o una función que lo
+    calcula a partir de la petición; si devuelve None la ruta no se limita.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            nombre = clase() if callable(clase) else clase
+            if nombre is None:
+                return vista(*args, **kwargs)
+            try:
+                with control.admitir(nombre):
+                    return vista(*args, **kwargs)
+            except Rechazado:
+                respuesta = make_response(
+                    jsonify({'error': 'Servicio saturado, intenta más tarde', 'clase': nombre}), 503
+                )
+                respuesta.headers['Retry-After'] = str(retry_after)
+                return respuesta
+        return envoltura
+    return decorador
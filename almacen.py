@@ -0,0 +1,172 @@
+"""
+Almacenamiento normalizado de contribuyentes.
+
+En modo 'normalizado' todos los registros viven en una sola tabla,
+Contribuyentes, con el RFC como llave primaria. Los nombres de tabla
+históricos (Definitivos, Presuntos, ..., Listado_Completo_69_B) pasan a ser
+vistas sobre ella, de modo que ver_tabla, exportar_tabla y las estadísticas
+siguen funcionando sin cambios.
+"""
+
+import time
+
+from config import ALMACENAMIENTO_CONFIG
+
+MODO_NORMALIZADO = ALMACENAMIENTO_CONFIG.get('modo') == 'normalizado'
+
+TABLA_CANONICA = 'Contribuyentes'
+
+# Situación del contribuyente → vista con el nombre de la tabla histórica
+SITUACION_TABLA = {
+    'Definitivo': 'Definitivos',
+    'Desvirtuado': 'Desvirtuados',
+    'Presunto': 'Presuntos',
+    'Sentencia Favorable': 'SentenciasFavorables',
+}
+TABLA_SITUACION = {tabla: situacion for situacion, tabla in SITUACION_TABLA.items()}
+
+TABLA_COMPLETA = 'Listado_Completo_69_B'
+
+COLUMNAS = [
+    'rfc', 'numero', 'nombre_contribuyente', 'situacion_contribuyente',
+    'oficio_presuncion_sat', 'publicacion_sat_presuntos',
+    'oficio_presuncion_dof', 'publicacion_dof_presuntos',
+    'oficio_desvirtuado_sat', 'publicacion_sat_desvirtuados',
+    'oficio_desvirtuado_dof', 'publicacion_dof_desvirtuados',
+    'oficio_definitivo_sat', 'publicacion_sat_definitivos',
+    'oficio_definitivo_dof', 'publicacion_dof_definitivos',
+    'oficio_sentencia_sat', 'publicacion_sat_sentencia',
+    'oficio_sentencia_dof', 'publicacion_dof_sentencia',
+    'fecha_actualizacion',
+]
+
+DDL_CONTRIBUYENTES = f"""
+    CREATE TABLE IF NOT EXISTS {TABLA_CANONICA} (
+        rfc VARCHAR(20) NOT NULL PRIMARY KEY,
+        numero INT NULL,
+        nombre_contribuyente VARCHAR(500) NULL,
+        situacion_contribuyente VARCHAR(50) NULL,
+        oficio_presuncion_sat VARCHAR(255) NULL,
+        publicacion_sat_presuntos DATE NULL,
+        oficio_presuncion_dof VARCHAR(255) NULL,
+        publicacion_dof_presuntos DATE NULL,
+        oficio_desvirtuado_sat VARCHAR(255) NULL,
+        publicacion_sat_desvirtuados DATE NULL,
+        oficio_desvirtuado_dof VARCHAR(255) NULL,
+        publicacion_dof_desvirtuados DATE NULL,
+        oficio_definitivo_sat VARCHAR(255) NULL,
+        publicacion_sat_definitivos DATE NULL,
+        oficio_definitivo_dof VARCHAR(255) NULL,
+        publicacion_dof_definitivos DATE NULL,
+        oficio_sentencia_sat VARCHAR(255) NULL,
+        publicacion_sat_sentencia DATE NULL,
+        oficio_sentencia_dof VARCHAR(255) NULL,
+        publicacion_dof_sentencia DATE NULL,
+        fecha_actualizacion DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        KEY idx_situacion_numero (situacion_contribuyente, numero),
+        KEY idx_numero (numero),
+        KEY idx_nombre (nombre_contribuyente(100))
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+# ---------------------------------------------------------
+# Esquema y migración
+# ---------------------------------------------------------
+
+def _tablas_base_existentes(cursor, nombres):
+    placeholders = ", ".join(["%s"] * len(nombres))
+    cursor.execute(f"""
+        SELECT TABLE_NAME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_TYPE = 'BASE TABLE'
+          AND TABLE_NAME IN ({placeholders})
+    """, list(nombres))
+    return {fila[0] for fila in cursor.fetchall()}
+
+
+def _columnas(cursor, tabla):
+    cursor.execute(f"DESCRIBE {tabla}")
+    return [fila[0] for fila in cursor.fetchall()]
+
+
+def preparar_esquema(cursor):
+    """
+    Crea Contribuyentes y las vistas de compatibilidad. Si los nombres
+    históricos todavía son tablas, sus datos se copian a Contribuyentes y
+    la tabla se renombra a <nombre>_anterior (con la fecha como sufijo si
+    ya existe de una migración previa) antes de crear la vista.
+    """
+    cursor.execute(DDL_CONTRIBUYENTES)
+
+    # El listado completo primero: es la fuente más completa de cada RFC
+    historicas = [TABLA_COMPLETA] + list(SITUACION_TABLA.values())
+    anteriores = [f"{tabla}_anterior" for tabla in historicas]
+    existentes = _tablas_base_existentes(cursor, historicas + anteriores + ['Conteo_RFC'])
+
+    # El índice de duplicados no se mantiene en modo normalizado: sus conteos
+    # dejarían de coincidir con los datos en cuanto llegue la primera carga
+    if 'Conteo_RFC' in existentes:
+        cursor.execute("DELETE FROM Conteo_RFC")
+
+    for tabla in historicas:
+        if tabla not in existentes:
+            continue
+        comunes = [c for c in _columnas(cursor, tabla) if c in COLUMNAS]
+        if 'rfc' in comunes:
+            columnas_sql = ", ".join(comunes)
+            cursor.execute(f"""
+                INSERT IGNORE INTO {TABLA_CANONICA} ({columnas_sql})
+                SELECT {columnas_sql} FROM {tabla}
+                WHERE rfc IS NOT NULL
+            """)
+        respaldo = f"{tabla}_anterior"
+        if respaldo in existentes:
+            respaldo = f"{respaldo}_{time.strftime('%Y%m%d%H%M%S')}"
+        cursor.execute(f"RENAME TABLE {tabla} TO {respaldo}")
+
+    columnas_sql = ", ".join(COLUMNAS)
+    cursor.execute(f"""
+        CREATE OR REPLACE VIEW {TABLA_COMPLETA} AS
+        SELECT {columnas_sql} FROM {TABLA_CANONICA}
+    """)
+    for situacion, tabla in SITUACION_TABLA.items():
+        cursor.execute(f"""
+            CREATE OR REPLACE VIEW {tabla} AS
+            SELECT {columnas_sql} FROM {TABLA_CANONICA}
+            WHERE situacion_contribuyente = '{situacion}'
+        """)
+
+
+# ---------------------------------------------------------
+# Escritura y consulta
+# ---------------------------------------------------------
+
+def sql_upsert(columnas):
+    """INSERT ... ON DUPLICATE KEY UPDATE sobre Contribuyentes (una escritura por fila)."""
+    columnas = [c for c in columnas if c in COLUMNAS]
+    placeholders = ", ".join(["%s"] * len(columnas))
+    actualizaciones = ", ".join(f"{c} = VALUES({c})" for c in columnas if c != 'rfc')
+    return columnas, (
+        f"INSERT INTO {TABLA_CANONICA} ({', '.join(columnas)}) VALUES ({placeholders}) "
+        f"ON DUPLICATE KEY UPDATE {actualizaciones}"
+    )
+
+
+def buscar_rfc(cursor, rfc):
+    """
+    Una sola lectura por llave primaria. Devuelve las mismas filas que
+    consultar las cinco tablas: una para la vista de su situación y otra
+    para el listado completo.
+    """
+    cursor.execute(f"SELECT * FROM {TABLA_CANONICA} WHERE rfc = %s", (rfc.strip().upper(),))
+    fila = cursor.fetchone()
+    if not fila:
+        return []
+
+    resultados = []
+    tabla = SITUACION_TABLA.get(fila.get('situacion_contribuyente'))
+    if tabla:
+        resultados.append(dict(fila, tabla_origen=tabla))
+    resultados.append(dict(fila, tabla_origen=TABLA_COMPLETA))
+    return resultados
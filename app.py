@@ -4,14 +4,29 @@ Sistema SAT - Interfaz Web (Flask)
 Versión limpia, sin duplicados, lista para producción.
 """
 
-from flask import Flask, render_template, request, jsonify, flash, redirect, send_file
-from config import DB_CONFIG
+from flask import Flask, render_template, request, jsonify, flash, redirect, send_file, send_from_directory
+from config import (
+    CRIBADO_CONFIG, IMPORT_CONFIG, SIMILITUD_CONFIG, ADMISION_CONFIG, SUGERENCIAS_CONFIG,
+    PERFILADO_CONFIG, EXPORTACION_CONFIG, CARGA_CONFIG, SUBIDAS_CONFIG, SERVIDOR_CONFIG
+)
+from cribado import obtener_filtro, invalidar_filtro, cribar_archivo
+from duplicados import contar_duplicados, listar_duplicados, registrar_rfcs
+import duplicados as indice_duplicados
+import almacen
+import historial
+import similitud
+from admision import ControlAdmision, limitar
+from conexiones import conectar_primario, conectar_lectura, marcar_escritura
+import sugerencias
+import perfilado
+import exportaciones
+import subidas
 import mysql.connector
 from datetime import datetime
 import pandas as pd
 import os
-import io
-import csv
+import tempfile
+import threading
 import traceback
 import json
 
@@ -27,16 +42,44 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(CRIBADO_CONFIG['carpeta_reportes'], exist_ok=True)
+os.makedirs(SUBIDAS_CONFIG['carpeta'], exist_ok=True)
 
 ALLOWED_EXTENSIONS = {'txt'}
 
+perfilado.instalar(app, PERFILADO_CONFIG)
+
+control_admision = ControlAdmision(
+    ADMISION_CONFIG['carpeta'],
+    ADMISION_CONFIG['clases'],
+    espera_maxima=ADMISION_CONFIG['espera_maxima'],
+    intervalo_sondeo=ADMISION_CONFIG['intervalo_sondeo']
+)
+
+# Cada petición en ejecución o en cola ocupa un hilo de gunicorn: si los límites
+# superan la capacidad, las colas nunca se llenan y no hay rechazos rápidos
+capacidad = SERVIDOR_CONFIG['workers'] * SERVIDOR_CONFIG['threads']
+reservadas = sum(l['concurrencia'] + l['cola'] for l in ADMISION_CONFIG['clases'].values())
+if reservadas > capacidad:
+    print(f"Advertencia: ADMISION_CONFIG reserva {reservadas} hilos y gunicorn solo tiene "
+          f"{capacidad} ({SERVIDOR_CONFIG['workers']} workers x {SERVIDOR_CONFIG['threads']} threads)")
+
+def limitar_clase(clase):
+    return limitar(control_admision, clase, ADMISION_CONFIG['retry_after'])
+
+def clase_busqueda():
+    return 'consulta' if request.args.get('type', 'rfc') == 'rfc' else 'busqueda'
+
+def clase_carga():
+    return 'carga' if request.method == 'POST' else None
+
 # ---------------------------------------------------------
 # UTILIDADES
 # ---------------------------------------------------------
 
 @app.route("/")
 def index():
-    conn = get_db_connection()
+    conn = get_db_connection(lectura=True)
     if not conn:
         return "Error de conexión a la base de datos", 500
 
@@ -134,13 +177,65 @@ def index():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_db_connection():
+def get_db_connection(lectura=False):
+    """Las rutas de solo lectura usan lectura=True y se enrutan a las réplicas."""
     try:
-        return mysql.connector.connect(**DB_CONFIG)
+        return conectar_lectura() if lectura else conectar_primario()
     except mysql.connector.Error as e:
         print(f"Error de base de datos: {e}")
         return None
 
+# Tablas auxiliares creadas después del primer despliegue: una instalación
+# actualizada sin volver a correr init_db.py las crea en el primer uso
+tablas_auxiliares = {'listas': False}
+tablas_auxiliares_lock = threading.Lock()
+
+def preparar_tablas_auxiliares():
+    """
+    Crea Conteo_RFC e Historial_Situacion si no existen y reconstruye el
+    índice de duplicados de las tablas con datos anteriores a él. Una vez por worker; GET_LOCK evita que varios
+    workers (o hosts) reconstruyan a la vez. Devuelve False si no se pudo.
+    """
+    with tablas_auxiliares_lock:
+        if tablas_auxiliares['listas']:
+            return True
+
+        conn = get_db_connection()
+        if not conn:
+            return False
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK('sat_tablas_auxiliares', 600)")
+            if cursor.fetchone()[0] != 1:
+                print("No se obtuvo el bloqueo para preparar las tablas auxiliares")
+                return False
+            try:
+                indice_duplicados.asegurar_tabla(cursor)
+                historial.asegurar_tabla(cursor)
+                # En modo normalizado el RFC es llave primaria: no hay índice que reconstruir
+                if not almacen.MODO_NORMALIZADO:
+                    tablas = ['Definitivos', 'Desvirtuados', 'Presuntos', 'SentenciasFavorables', 'Listado_Completo_69_B']
+                    for tabla in indice_duplicados.sin_indice(cursor, tablas):
+                        indice_duplicados.reconstruir(cursor, tabla)
+                        print(f"Índice de duplicados reconstruido para {tabla}")
+                conn.commit()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK('sat_tablas_auxiliares')")
+                cursor.fetchone()
+
+        except mysql.connector.Error:
+            traceback.print_exc()
+            conn.rollback()
+            return False
+
+        finally:
+            cursor.close()
+            conn.close()
+
+        tablas_auxiliares['listas'] = True
+        return True
+
 @app.context_processor
 def inject_now():
     return {'now': datetime.now(), 'app_name': 'Sistema SAT'}
@@ -169,6 +264,7 @@ def buscar_rfc_en_tablas(rfc, cursor):
 # ---------------------------------------------------------
 
 @app.route('/search')
+@limitar_clase(clase_busqueda)
 def search():
     query = request.args.get('q', '').strip()
     search_type = request.args.get('type', 'rfc')
@@ -178,7 +274,7 @@ def search():
 
     query = query.upper()  # Normalizamos a mayúsculas
 
-    conn = get_db_connection()
+    conn = get_db_connection(lectura=True)
     if not conn:
         return "Error de conexión a la base de datos", 500
 
@@ -188,7 +284,10 @@ def search():
         results = []
         tablas = ['Definitivos', 'Desvirtuados', 'Presuntos', 'SentenciasFavorables', 'Listado_Completo_69_B']
 
-        if search_type == 'rfc':
+        if search_type == 'rfc' and almacen.MODO_NORMALIZADO:
+            results = almacen.buscar_rfc(cursor, query)
+
+        elif search_type == 'rfc':
             for tabla in tablas:
                 cursor.execute(f"""
                     SELECT *, '{tabla}' AS tabla_origen
@@ -230,8 +329,9 @@ def search():
 # ---------------------------------------------------------
 
 @app.route('/api/contribuyente/<rfc>')
+@limitar_clase('consulta')
 def api_contribuyente(rfc):
-    conn = get_db_connection()
+    conn = get_db_connection(lectura=True)
     if not conn:
         return jsonify({'error': 'Error de conexión a la base de datos'}), 500
 
@@ -240,11 +340,14 @@ def api_contribuyente(rfc):
     results = []
 
     try:
-        for tabla in tablas:
-            cursor.execute(f"SELECT * FROM {tabla} WHERE UPPER(rfc) = %s", (rfc.upper(),))
-            for row in cursor.fetchall():
-                row['tabla_origen'] = tabla
-                results.append(row)
+        if almacen.MODO_NORMALIZADO:
+            results = almacen.buscar_rfc(cursor, rfc)
+        else:
+            for tabla in tablas:
+                cursor.execute(f"SELECT * FROM {tabla} WHERE UPPER(rfc) = %s", (rfc.upper(),))
+                for row in cursor.fetchall():
+                    row['tabla_origen'] = tabla
+                    results.append(row)
 
         cursor.close()
         conn.close()
@@ -255,13 +358,57 @@ def api_contribuyente(rfc):
         conn.close()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/contribuyente/<rfc>/historial')
+@limitar_clase('consulta')
+def api_historial_contribuyente(rfc):
+    preparar_tablas_auxiliares()
+    conn = get_db_connection(lectura=True)
+    if not conn:
+        return jsonify({'error': 'Error de conexión a la base de datos'}), 500
+
+    try:
+        eventos = historial.obtener_historial(conn, rfc)
+        conn.close()
+        return jsonify({
+            'rfc': rfc.upper(),
+            'situacion_actual': eventos[-1]['situacion'] if eventos else None,
+            'historial': eventos
+        })
+
+    except Exception as e:
+        conn.close()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sugerencias')
+@limitar_clase('sugerencias')
+def api_sugerencias():
+    q = request.args.get('q', '').strip()
+    limite = min(request.args.get('n', SUGERENCIAS_CONFIG['max_resultados'], type=int), 50)
+
+    if not q:
+        return jsonify([])
+
+    try:
+        tablas = ['Definitivos', 'Desvirtuados', 'Presuntos', 'SentenciasFavorables', 'Listado_Completo_69_B']
+        indice = sugerencias.obtener_indice(conectar_lectura, tablas, SUGERENCIAS_CONFIG['intervalo_verificacion'])
+        return jsonify(indice.buscar(q, limite))
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admision')
+def api_admision():
+    return jsonify(control_admision.estado())
+
 # ---------------------------------------------------------
 # ESTADÍSTICAS DETALLADAS
 # ---------------------------------------------------------
 
 @app.route('/estadisticas')
+@limitar_clase('busqueda')
 def estadisticas():
-    conn = get_db_connection()
+    preparar_tablas_auxiliares()
+    conn = get_db_connection(lectura=True)
     if not conn:
         return "Error de conexión a la base de datos", 500
 
@@ -276,20 +423,8 @@ def estadisticas():
             cursor.execute(f"SELECT COUNT(*) AS total FROM {tabla}")
             stats[tabla] = cursor.fetchone()['total']
 
-        # Duplicados
-        duplicates = {}
-        for tabla in tablas:
-            cursor.execute(f"""
-                SELECT COUNT(*) AS duplicate_count
-                FROM (
-                    SELECT rfc, COUNT(*) AS count
-                    FROM {tabla}
-                    WHERE rfc IS NOT NULL
-                    GROUP BY rfc
-                    HAVING COUNT(*) > 1
-                ) AS dups
-            """)
-            duplicates[tabla] = cursor.fetchone()['duplicate_count']
+        # Duplicados (índice Conteo_RFC mantenido en cada carga)
+        duplicates = contar_duplicados(conn, tablas)
 
         # Situaciones
         cursor.execute("""
@@ -334,6 +469,47 @@ def estadisticas():
         conn.close()
         return f"Error: {e}", 500
 
+@app.route('/estadisticas/duplicados/<nombre_tabla>')
+@limitar_clase('busqueda')
+def ver_duplicados(nombre_tabla):
+    tablas_validas = {
+        'definitivos': 'Definitivos',
+        'desvirtuados': 'Desvirtuados',
+        'presuntos': 'Presuntos',
+        'sentenciasfavorables': 'SentenciasFavorables',
+        'listado_completo_69_b': 'Listado_Completo_69_B'
+    }
+
+    tabla_real = tablas_validas.get(nombre_tabla.lower())
+    if not tabla_real:
+        return "Tabla no válida", 400
+
+    preparar_tablas_auxiliares()
+    conn = get_db_connection(lectura=True)
+    if not conn:
+        return "Error de conexión a la base de datos", 500
+
+    try:
+        page = request.args.get('page', 1, type=int)
+        per_page = 50
+
+        duplicados, total = listar_duplicados(conn, tabla_real, per_page, (page - 1) * per_page)
+        conn.close()
+
+        return render_template(
+            'duplicados.html',
+            tabla=tabla_real,
+            ruta=nombre_tabla.lower(),
+            duplicados=duplicados,
+            page=page,
+            total_pages=(total + per_page - 1) // per_page,
+            total=total
+        )
+
+    except Exception as e:
+        conn.close()
+        return f"Error: {e}", 500
+
 # ---------------------------------------------------------
 # TABLAS
 # ---------------------------------------------------------
@@ -351,7 +527,7 @@ def tablas():
 
 @app.route('/tabla/<nombre_tabla>')
 def ver_tabla(nombre_tabla):
-    conn = get_db_connection()
+    conn = get_db_connection(lectura=True)
     if not conn:
         return "Error de conexión a la base de datos", 500
 
@@ -421,60 +597,212 @@ def ver_tabla(nombre_tabla):
 # ---------------------------------------------------------
 
 @app.route('/exportar/<nombre_tabla>')
+@limitar_clase('exportacion')
 def exportar_tabla(nombre_tabla):
+    tablas_validas = {
+        'definitivos': 'Definitivos',
+        'desvirtuados': 'Desvirtuados',
+        'presuntos': 'Presuntos',
+        'sentenciasfavorables': 'SentenciasFavorables',
+        'listado_completo_69_b': 'Listado_Completo_69_B'
+    }
+
+    tabla_real = tablas_validas.get(nombre_tabla.lower())
+    if tabla_real is None:
+        return "Tabla no válida", 400
+
+    carpeta = EXPORTACION_CONFIG['carpeta']
+
+    # Versión pre-comprimida para clientes con gzip (las peticiones Range usan el CSV plano)
+    if request.args.get('formato') == 'csv.gz':
+        formato, mimetype, codificacion = 'csv.gz', 'application/gzip', None
+    elif 'gzip' in request.accept_encodings and 'Range' not in request.headers:
+        formato, mimetype, codificacion = 'csv.gz', 'text/csv', 'gzip'
+    else:
+        formato, mimetype, codificacion = 'csv', 'text/csv', None
+
+    # Las cargas generan la exportación; si aún no existe (o una carga fallida
+    # retiró el puntero) se genera aquí. El archivo puede desaparecer entre la
+    # generación y el envío si otra carga lo retira o lo limpia: se reintenta
+    for _ in range(2):
+        encontrado = exportaciones.artefacto(carpeta, tabla_real, formato)
+
+        if encontrado is None:
+            conn = get_db_connection(lectura=True)
+            if not conn:
+                return "Error de conexión a la base de datos", 500
+            try:
+                exportaciones.generar(conn, tabla_real, carpeta,
+                                      EXPORTACION_CONFIG['versiones_conservadas'],
+                                      EXPORTACION_CONFIG['nivel_gzip'])
+            except Exception as e:
+                return f"Error: {e}", 500
+            finally:
+                conn.close()
+            encontrado = exportaciones.artefacto(carpeta, tabla_real, formato)
+            if encontrado is None:
+                continue
+
+        ruta, fecha = encontrado
+        download_name = f"{tabla_real}_{fecha}.csv"
+        if formato == 'csv.gz' and codificacion is None:
+            download_name += '.gz'
+
+        try:
+            # send_file abre el archivo: a partir de aquí limpiar() ya no lo afecta
+            respuesta = send_file(ruta, mimetype=mimetype, as_attachment=True,
+                                  download_name=download_name, conditional=True)
+        except FileNotFoundError:
+            continue
+
+        if codificacion:
+            respuesta.headers['Content-Encoding'] = codificacion
+        if request.args.get('formato') != 'csv.gz':
+            respuesta.headers['Vary'] = 'Accept-Encoding'
+        return respuesta
+
+    return "La exportación se está actualizando, intenta de nuevo", 503, {'Retry-After': '5'}
+
+# ---------------------------------------------------------
+# CARGA CSV
+# ---------------------------------------------------------
+
+def procesar_csv(fuente, nombre_archivo, tabla_real, fecha_publicacion=None):
+    """
+    Inserta el CSV `fuente` (ruta o archivo abierto) en `tabla_real` por
+    lotes de filas, en una sola transacción. Devuelve el total de registros;
+    los errores de contenido se reportan con ValueError.
+    """
+    preparar_tablas_auxiliares()
     conn = get_db_connection()
     if not conn:
-        return "Error de conexión a la base de datos", 500
+        raise RuntimeError('Error de conexión a la base de datos')
 
     cursor = conn.cursor(dictionary=True)
+    total = 0
 
     try:
-        tablas_validas = {
-            'definitivos': 'Definitivos',
-            'desvirtuados': 'Desvirtuados',
-            'presuntos': 'Presuntos',
-            'sentenciasfavorables': 'SentenciasFavorables',
-            'listado_completo_69_b': 'Listado_Completo_69_B'
-        }
+        # Antes de escribir nada: permite decidir al final si el índice de
+        # sugerencias de este worker puede adoptar la nueva versión
+        previo = sugerencias.estado_previo(conn)
 
-        tabla_real = tablas_validas.get(nombre_tabla.lower())
-        if tabla_real is None:
-            return "Tabla no válida", 400
+        cursor.execute(f"DESCRIBE {tabla_real}")
+        columnas_tabla = [col['Field'] for col in cursor.fetchall()]
 
-        cursor.execute(f"SELECT * FROM {tabla_real} ORDER BY numero")
-        registros = cursor.fetchall()
+        fecha_publicacion = fecha_publicacion or IMPORT_CONFIG['fechas_actualizacion'].get(tabla_real)
+        situacion_tabla = almacen.TABLA_SITUACION.get(tabla_real)
 
-        output = io.StringIO()
-        writer = csv.writer(output)
+        for df in pd.read_csv(fuente, chunksize=CARGA_CONFIG['filas_por_lote']):
+            columnas_validas = [c for c in df.columns if c in columnas_tabla]
 
-        if registros:
-            writer.writerow(registros[0].keys())
+            if not columnas_validas:
+                raise ValueError('El CSV no contiene columnas válidas para esta tabla')
 
-        for registro in registros:
-            writer.writerow(registro.values())
+            df = df[columnas_validas]
 
-        output.seek(0)
+            # Un CSV con solo encabezado produce un lote vacío
+            if df.empty:
+                continue
 
-        cursor.close()
-        conn.close()
+            if almacen.MODO_NORMALIZADO:
+                if 'rfc' not in columnas_validas:
+                    raise ValueError('El CSV debe incluir la columna rfc')
 
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype="text/csv",
-            as_attachment=True,
-            download_name=f"{tabla_real}_{datetime.now().strftime('%Y%m%d')}.csv"
-        )
+                # Las vistas por situación toman la situación de la tabla destino
+                if situacion_tabla:
+                    df = df.assign(situacion_contribuyente=situacion_tabla)
+                df = df[df['rfc'].notna()]
+                df = df.assign(rfc=df['rfc'].astype(str).str.strip().str.upper())
 
-    except Exception as e:
+                columnas_validas, query = almacen.sql_upsert(list(df.columns))
+                df = df[columnas_validas]
+            else:
+                placeholders = ", ".join(["%s"] * len(columnas_validas))
+                columnas_sql = ", ".join(columnas_validas)
+                query = f"INSERT INTO {tabla_real} ({columnas_sql}) VALUES ({placeholders})"
+
+            df = df.where(pd.notnull(df), None)
+
+            registros = df.values.tolist()
+            if not registros:
+                continue
+            cursor.executemany(query, registros)
+            # rowcount no sirve: ON DUPLICATE KEY UPDATE cuenta doble cada actualización
+            total += len(registros)
+            # Si la petición se perfila, las asignaciones se toman con el lote aún en memoria
+            perfilado.marcar_pico()
+
+            if 'rfc' not in columnas_validas:
+                continue
+
+            # En modo normalizado el RFC es llave primaria: no hay duplicados que indexar
+            if not almacen.MODO_NORMALIZADO:
+                registrar_rfcs(cursor, tabla_real, df['rfc'])
+
+            # Historial: solo los RFCs cuya situación cambió
+            if 'situacion_contribuyente' in columnas_validas:
+                situaciones = dict(zip(df['rfc'], df['situacion_contribuyente']))
+                historial.registrar_cambios(conn, situaciones, fecha_publicacion, nombre_archivo)
+            elif situacion_tabla:
+                situaciones = dict.fromkeys(df['rfc'], situacion_tabla)
+                historial.registrar_cambios(conn, situaciones, fecha_publicacion, nombre_archivo)
+
+            # En modo normalizado una carga puede mover RFCs de lista: se reconstruye al final
+            if not almacen.MODO_NORMALIZADO:
+                nombres = df['nombre_contribuyente'] if 'nombre_contribuyente' in columnas_validas else [None] * len(df)
+                sugerencias.agregar_registros(zip(df['rfc'], nombres, [tabla_real] * len(df)))
+
+        if total == 0:
+            raise ValueError('El archivo CSV está vacío')
+
+        conn.commit()
+
+        # Registrar en historial
+        cursor.execute("""
+            INSERT INTO Historial_Cargas (nombre_archivo, tabla, registros)
+            VALUES (%s, %s, %s)
+        """, (nombre_archivo, tabla_real, total))
+        conn.commit()
+        marcar_escritura(conn)
+
+        if almacen.MODO_NORMALIZADO:
+            sugerencias.invalidar_indice()
+        else:
+            sugerencias.adoptar_version(conn, previo)
+
+        # Exportaciones pre-generadas; en modo normalizado la carga puede afectar a todas las vistas
+        if almacen.MODO_NORMALIZADO:
+            tablas_afectadas = list(almacen.SITUACION_TABLA.values()) + [almacen.TABLA_COMPLETA]
+        else:
+            tablas_afectadas = [tabla_real]
+        for tabla_afectada in tablas_afectadas:
+            try:
+                exportaciones.generar(conn, tabla_afectada, EXPORTACION_CONFIG['carpeta'],
+                                      EXPORTACION_CONFIG['versiones_conservadas'],
+                                      EXPORTACION_CONFIG['nivel_gzip'])
+            except Exception:
+                # Los datos ya están guardados: sin puntero, /exportar genera la
+                # exportación al pedirla en lugar de servir la versión anterior
+                traceback.print_exc()
+                exportaciones.retirar(EXPORTACION_CONFIG['carpeta'], tabla_afectada)
+
+    except Exception:
+        conn.rollback()
+        # El índice de sugerencias pudo recibir filas que no se guardaron
+        sugerencias.invalidar_indice()
+        raise
+
+    finally:
         cursor.close()
         conn.close()
-        return f"Error: {e}", 500
 
-# ---------------------------------------------------------
-# CARGA CSV
-# ---------------------------------------------------------
+    invalidar_filtro()
+    similitud.invalidar_indice()
+    return total
+
 
 @app.route('/carga_csv', methods=['GET', 'POST'])
+@limitar_clase(clase_carga)
 def carga_csv():
     if request.method == 'POST':
         if 'archivo' not in request.files:
@@ -506,56 +834,152 @@ def carga_csv():
             return redirect(request.url)
 
         try:
-            df = pd.read_csv(archivo)
+            total = procesar_csv(archivo, archivo.filename, tabla_real, request.form.get('fecha_publicacion'))
 
-            if df.empty:
-                flash('El archivo CSV está vacío', 'danger')
-                return redirect(request.url)
+            flash(f"✅ Se cargaron {total} registros correctamente en la tabla {tabla_real}", "success")
+            return redirect(request.url)
 
-            conn = get_db_connection()
-            cursor = conn.cursor(dictionary=True)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(request.url)
 
-            cursor.execute(f"DESCRIBE {tabla_real}")
-            columnas_tabla = [col['Field'] for col in cursor.fetchall()]
+        except Exception as e:
+            traceback.print_exc()
+            flash(f"Error procesando el archivo: {str(e)}", "danger")
+            return redirect(request.url)
 
-            columnas_validas = [c for c in df.columns if c in columnas_tabla]
+    return render_template('carga_csv.html', tam_parte=SUBIDAS_CONFIG['tam_parte'])
 
-            if not columnas_validas:
-                flash('El CSV no contiene columnas válidas para esta tabla', 'danger')
-                return redirect(request.url)
+# ---------------------------------------------------------
+# SUBIDAS POR PARTES (CSV GRANDES)
+# ---------------------------------------------------------
 
-            df = df[columnas_validas]
-            df = df.where(pd.notnull(df), None)
+@app.route('/api/subidas', methods=['POST'])
+def api_iniciar_subida():
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify({'error': 'Se esperaba un objeto JSON'}), 400
+
+    # Los campos de texto llegan del cliente: cualquier otro tipo es un 400, no un 500
+    for campo in ('nombre_archivo', 'tipo', 'tabla', 'fecha_publicacion', 'nombre_reporte'):
+        if datos.get(campo) is not None and not isinstance(datos[campo], str):
+            return jsonify({'error': f"El campo {campo} debe ser texto"}), 400
+
+    nombre_archivo = secure_filename(datos.get('nombre_archivo') or '')
+    tamano = datos.get('tamano')
+    tipo = datos.get('tipo') or 'csv'
+
+    if not isinstance(tamano, int) or isinstance(tamano, bool) or tamano <= 0:
+        return jsonify({'error': 'Tamaño de archivo no válido'}), 400
+
+    # El destino indica qué hacer con el archivo al finalizar: cargarlo a una
+    # tabla (csv) o cribarlo contra las listas (rfcs, nombres)
+    if tipo == 'csv':
+        if not nombre_archivo.lower().endswith('.csv'):
+            return jsonify({'error': 'Solo se permiten archivos CSV'}), 400
+        tabla = (datos.get('tabla') or '').lower()
+        if tabla not in {
+            'definitivos', 'desvirtuados', 'presuntos', 'sentenciasfavorables', 'listado_completo_69_b'
+        }:
+            return jsonify({'error': 'Tabla destino no válida'}), 400
+        fecha_publicacion = datos.get('fecha_publicacion') or None
+        if fecha_publicacion:
+            try:
+                datetime.strptime(fecha_publicacion, '%Y-%m-%d')
+            except ValueError:
+                return jsonify({'error': 'Fecha de publicación no válida (AAAA-MM-DD)'}), 400
+        destino = {'tipo': tipo, 'tabla': tabla, 'fecha_publicacion': fecha_publicacion}
+
+    elif tipo in ('rfcs', 'nombres'):
+        if not nombre_archivo.lower().endswith('.txt'):
+            return jsonify({'error': 'Solo se permiten archivos TXT'}), 400
+        destino = {
+            'tipo': tipo,
+            'nombre_reporte': secure_filename(datos.get('nombre_reporte') or '') or
+                              ('reporte' if tipo == 'rfcs' else 'nombres'),
+        }
+        if tipo == 'nombres':
+            try:
+                destino['umbral'] = float(datos.get('umbral', SIMILITUD_CONFIG['umbral']))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Umbral no válido'}), 400
 
-            placeholders = ", ".join(["%s"] * len(columnas_validas))
-            columnas_sql = ", ".join(columnas_validas)
-            query = f"INSERT INTO {tabla_real} ({columnas_sql}) VALUES ({placeholders})"
+    else:
+        return jsonify({'error': 'Tipo de subida no válido'}), 400
 
-            registros = df.values.tolist()
-            cursor.executemany(query, registros)
-            conn.commit()
+    subidas.purgar_expiradas(SUBIDAS_CONFIG['carpeta'], SUBIDAS_CONFIG['horas_expiracion'])
 
-            total = cursor.rowcount
+    meta = subidas.iniciar(
+        SUBIDAS_CONFIG['carpeta'], nombre_archivo, tamano, SUBIDAS_CONFIG['tam_parte'],
+        destino=destino, sha256=datos.get('sha256')
+    )
+    return jsonify(meta), 201
 
-            # Registrar en historial
-            cursor.execute("""
-                INSERT INTO Historial_Cargas (nombre_archivo, tabla, registros)
-                VALUES (%s, %s, %s)
-            """, (archivo.filename, tabla_real, total))
-            conn.commit()
+@app.route('/api/subidas/<id_subida>')
+def api_estado_subida(id_subida):
+    try:
+        return jsonify(subidas.estado(SUBIDAS_CONFIG['carpeta'], id_subida))
+    except subidas.ErrorSubida as e:
+        return jsonify({'error': str(e)}), 404
 
-            cursor.close()
-            conn.close()
+@app.route('/api/subidas/<id_subida>/partes/<int:numero>', methods=['PUT'])
+def api_parte_subida(id_subida, numero):
+    try:
+        escritos = subidas.guardar_parte(
+            SUBIDAS_CONFIG['carpeta'], id_subida, numero,
+            request.stream, request.headers.get('X-Checksum-SHA256')
+        )
+        return jsonify({'parte': numero, 'bytes': escritos})
+    except subidas.ErrorSubida as e:
+        return jsonify({'error': str(e)}), 400
 
-            flash(f"✅ Se cargaron {total} registros correctamente en la tabla {tabla_real}", "success")
-            return redirect(request.url)
+@app.route('/api/subidas/<id_subida>/finalizar', methods=['POST'])
+@limitar_clase('carga')
+def api_finalizar_subida(id_subida):
+    try:
+        ruta, meta = subidas.ensamblar(SUBIDAS_CONFIG['carpeta'], id_subida, app.config['UPLOAD_FOLDER'])
+    except subidas.ErrorSubida as e:
+        return jsonify({'error': str(e)}), 400
 
-        except Exception as e:
-            traceback.print_exc()
-            flash(f"Error procesando el archivo: {str(e)}", "danger")
-            return redirect(request.url)
+    destino = meta['destino']
+
+    # Las partes se conservan hasta que el procesamiento termina bien: ante un
+    # error transitorio (base de datos caída) basta con volver a finalizar
+    try:
+        if destino.get('tipo', 'csv') == 'csv':
+            tablas_validas = {
+                'definitivos': 'Definitivos',
+                'desvirtuados': 'Desvirtuados',
+                'presuntos': 'Presuntos',
+                'sentenciasfavorables': 'SentenciasFavorables',
+                'listado_completo_69_b': 'Listado_Completo_69_B'
+            }
+            tabla_real = tablas_validas[destino['tabla']]
+            total = procesar_csv(ruta, meta['nombre_archivo'], tabla_real, destino.get('fecha_publicacion'))
+            respuesta = {'tabla': tabla_real, 'registros': total}
+
+        elif destino['tipo'] == 'rfcs':
+            resumen, nombre_csv = cribar_rfcs_en_archivo(ruta, destino['nombre_reporte'])
+            respuesta = dict(resumen, reporte=f"/reportes/{nombre_csv}")
+
+        else:
+            resumen, nombre_csv = cribar_nombres_en_archivo(ruta, destino['nombre_reporte'], destino['umbral'])
+            respuesta = dict(resumen, umbral=destino['umbral'], reporte=f"/reportes/{nombre_csv}")
+
+        subidas.descartar(SUBIDAS_CONFIG['carpeta'], id_subida)
+        return jsonify(respuesta)
+
+    except ValueError as e:
+        # Error de contenido: reintentar no sirve, la subida se descarta
+        subidas.descartar(SUBIDAS_CONFIG['carpeta'], id_subida)
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({'error': f"Error procesando el archivo: {e}"}), 500
 
-    return render_template('carga_csv.html')
+    finally:
+        os.remove(ruta)
 
 # ---------------------------------------------------------
 # HISTORIAL DE CARGAS
@@ -563,7 +987,7 @@ def carga_csv():
 
 @app.route('/historial_cargas')
 def historial_cargas():
-    conn = get_db_connection()
+    conn = get_db_connection(lectura=True)
     cursor = conn.cursor(dictionary=True)
 
     cursor.execute("SELECT * FROM Historial_Cargas ORDER BY fecha DESC LIMIT 200")
@@ -578,25 +1002,125 @@ def historial_cargas():
 # CARGA MASIVA TXT
 # ---------------------------------------------------------
 
+def cribar_rfcs_en_archivo(ruta, nombre_reporte):
+    """Criba un TXT de RFCs ya guardado en disco. Devuelve (resumen, nombre del reporte)."""
+    conn = get_db_connection(lectura=True)
+    if not conn:
+        raise ConnectionError('Error de conexión a la base de datos')
+
+    nombre_csv = f"{nombre_reporte}_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+    ruta_reporte = os.path.join(CRIBADO_CONFIG['carpeta_reportes'], nombre_csv)
+
+    try:
+        tablas = ['Definitivos', 'Desvirtuados', 'Presuntos', 'SentenciasFavorables', 'Listado_Completo_69_B']
+        filtro = obtener_filtro(conn, tablas, CRIBADO_CONFIG['tasa_falsos_positivos'])
+        resumen = cribar_archivo(ruta, ruta_reporte, conn, filtro, tablas,
+                                 tam_lote=CRIBADO_CONFIG['tam_lote'])
+        return resumen, nombre_csv
+    finally:
+        conn.close()
+
 @app.route('/carga_masiva', methods=['GET', 'POST'])
+@limitar_clase(clase_carga)
 def carga_masiva():
     if request.method == 'POST':
         archivo = request.files.get('archivo')
-        nombre_reporte = request.form.get('nombre_reporte', 'reporte')
+        nombre_reporte = secure_filename(request.form.get('nombre_reporte') or '') or 'reporte'
 
         if not archivo or archivo.filename == '':
-            flash(('danger', 'No seleccionaste ningún archivo'))
+            flash('No seleccionaste ningún archivo', 'danger')
             return redirect(request.url)
 
-        try:
-            contenido = archivo.read().decode('latin1').splitlines()
-            rfcs = [line.strip().upper() for line in contenido if line.strip()]
+        # El archivo se guarda en disco y se lee línea por línea. Los archivos
+        # grandes no llegan por aquí: la página los envía por /api/subidas
+        # Nombre único: dos subidas con el mismo nombre no deben pisarse
+        fd, ruta = tempfile.mkstemp(suffix='.txt', dir=app.config['UPLOAD_FOLDER'])
+        os.close(fd)
 
-            flash(('success', f'Se procesaron {len(rfcs)} RFCs correctamente'))
+        try:
+            archivo.save(ruta)
+            resumen, nombre_csv = cribar_rfcs_en_archivo(ruta, nombre_reporte)
+
+            flash(
+                f"Se procesaron {resumen['procesados']} RFCs: {resumen['encontrados']} encontrados "
+                f"en las listas. Reporte: /reportes/{nombre_csv}",
+                'success'
+            )
             return redirect('/carga_masiva')
 
         except Exception as e:
-            flash(('danger', f'Error procesando archivo: {e}'))
+            traceback.print_exc()
+            flash(f'Error procesando archivo: {e}', 'danger')
             return redirect('/carga_masiva')
 
-    return render_template('carga_masiva.html')
+        finally:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+    return render_template('carga_masiva.html', tam_parte=SUBIDAS_CONFIG['tam_parte'])
+
+# ---------------------------------------------------------
+# CARGA MASIVA DE NOMBRES (SIMILITUD)
+# ---------------------------------------------------------
+
+def cribar_nombres_en_archivo(ruta, nombre_reporte, umbral):
+    """Criba un TXT de nombres ya guardado en disco. Devuelve (resumen, nombre del reporte)."""
+    conn = get_db_connection(lectura=True)
+    if not conn:
+        raise ConnectionError('Error de conexión a la base de datos')
+
+    nombre_csv = f"{nombre_reporte}_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+    ruta_reporte = os.path.join(CRIBADO_CONFIG['carpeta_reportes'], nombre_csv)
+
+    try:
+        tablas = ['Definitivos', 'Desvirtuados', 'Presuntos', 'SentenciasFavorables', 'Listado_Completo_69_B']
+        indice = similitud.obtener_indice(conn, tablas, SIMILITUD_CONFIG['frecuencia_max_trigrama'])
+        resumen = similitud.cribar_nombres(ruta, ruta_reporte, indice, umbral,
+                                           SIMILITUD_CONFIG['max_resultados'])
+        return resumen, nombre_csv
+    finally:
+        conn.close()
+
+@app.route('/carga_nombres', methods=['GET', 'POST'])
+@limitar_clase(clase_carga)
+def carga_nombres():
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        nombre_reporte = secure_filename(request.form.get('nombre_reporte') or '') or 'nombres'
+        umbral = request.form.get('umbral', SIMILITUD_CONFIG['umbral'], type=float)
+
+        if not archivo or archivo.filename == '':
+            flash('No seleccionaste ningún archivo', 'danger')
+            return redirect(request.url)
+
+        # Nombre único: dos subidas con el mismo nombre no deben pisarse
+        fd, ruta = tempfile.mkstemp(suffix='.txt', dir=app.config['UPLOAD_FOLDER'])
+        os.close(fd)
+
+        try:
+            archivo.save(ruta)
+            resumen, nombre_csv = cribar_nombres_en_archivo(ruta, nombre_reporte, umbral)
+
+            flash(
+                f"Se procesaron {resumen['procesados']} nombres: {resumen['con_coincidencia']} con "
+                f"coincidencias sobre {umbral}. Reporte: /reportes/{nombre_csv}",
+                'success'
+            )
+            return redirect('/carga_nombres')
+
+        except Exception as e:
+            traceback.print_exc()
+            flash(f'Error procesando archivo: {e}', 'danger')
+            return redirect('/carga_nombres')
+
+        finally:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+    return render_template('carga_nombres.html', umbral=SIMILITUD_CONFIG['umbral'],
+                           tam_parte=SUBIDAS_CONFIG['tam_parte'])
+
+@app.route('/reportes/<nombre>')
+def descargar_reporte(nombre):
+    return send_from_directory(os.path.abspath(CRIBADO_CONFIG['carpeta_reportes']),
+                               secure_filename(nombre), as_attachment=True)
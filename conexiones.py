@@ -0,0 +1,117 @@
+"""
+Enrutamiento de conexiones: escrituras al primario, lecturas a réplicas.
+
+Las lecturas rotan entre DB_REPLICAS (round-robin) y saltan a la siguiente
+si una no responde; si ninguna está disponible se usa el primario. Después
+de una carga se guarda el GTID del primario en un archivo compartido, y
+durante la ventana de consistencia una réplica solo se usa si ya aplicó ese
+GTID (MASTER_GTID_WAIT); así quien acaba de cargar ve sus propios datos.
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+
+import mysql.connector
+
+from config import DB_CONFIG, DB_REPLICAS, REPLICACION_CONFIG
+
+_turno = itertools.count()
+_caidas = {}
+_lock = threading.Lock()
+
+
+def conectar_primario():
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+# ---------------------------------------------------------
+# Marca de escritura (read-your-writes)
+# ---------------------------------------------------------
+
+def marcar_escritura(conn):
+    """Registra la posición GTID actual del primario. Llamar tras el commit."""
+    gtid = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT @@gtid_binlog_pos")
+        fila = cursor.fetchone()
+        gtid = fila[0] if fila and fila[0] else None
+        cursor.close()
+    except mysql.connector.Error:
+        pass
+
+    ruta = REPLICACION_CONFIG['archivo_marca']
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w') as f:
+        json.dump({'gtid': gtid, 'instante': time.time()}, f)
+    os.replace(temporal, ruta)
+
+
+def _leer_marca():
+    try:
+        with open(REPLICACION_CONFIG['archivo_marca']) as f:
+            marca = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if time.time() - marca.get('instante', 0) > REPLICACION_CONFIG['ventana_consistencia']:
+        return None
+    return marca
+
+
+def _replica_al_dia(conn, marca):
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MASTER_GTID_WAIT(%s, %s)", (marca['gtid'], REPLICACION_CONFIG['espera_gtid']))
+        resultado = cursor.fetchone()[0]
+        cursor.close()
+    except mysql.connector.Error:
+        return False
+    return resultado == 0
+
+
+# ---------------------------------------------------------
+# Lecturas
+# ---------------------------------------------------------
+
+def _disponible(i):
+    with _lock:
+        return _caidas.get(i, 0) <= time.monotonic()
+
+
+def _marcar_caida(i):
+    with _lock:
+        _caidas[i] = time.monotonic() + REPLICACION_CONFIG['reintento_replica']
+
+
+def conectar_lectura():
+    if not DB_REPLICAS:
+        return conectar_primario()
+
+    marca = _leer_marca()
+    if marca is not None and not marca.get('gtid'):
+        # Sin GTID no se puede comprobar la réplica: durante la ventana se lee del primario
+        return conectar_primario()
+
+    inicio = next(_turno)
+
+    for k in range(len(DB_REPLICAS)):
+        i = (inicio + k) % len(DB_REPLICAS)
+        if not _disponible(i):
+            continue
+        try:
+            conn = mysql.connector.connect(
+                connection_timeout=REPLICACION_CONFIG['timeout_conexion'], **DB_REPLICAS[i]
+            )
+        except mysql.connector.Error as e:
+            print(f"Réplica {DB_REPLICAS[i].get('host')} no disponible: {e}")
+            _marcar_caida(i)
+            continue
+
+        if marca is None or _replica_al_dia(conn, marca):
+            return conn
+        conn.close()
+
+    return conectar_primario()
@@ -2,6 +2,8 @@
 Configuración centralizada para el sistema SAT
 """
 
+import os
+
 # Configuración de conexión a la base de datos
 DB_CONFIG = {
     "host": "mysql-sat",
@@ -20,6 +22,17 @@ CSV_FILES = {
     'SentenciasFavorables': 'data/SentenciasFavorables.csv',
     'Listado_Completo_69_B': 'data/Listado_Completo_69-B.csv'
 }
+# Réplicas de solo lectura (mismo formato que DB_CONFIG). Vacío = todo al primario.
+# Ejemplo: [{"host": "mariadb-replica", "user": "satuser", "password": "satpass", "database": "satdb"}]
+DB_REPLICAS = []
+
+REPLICACION_CONFIG = {
+    'timeout_conexion': 2,       # segundos para conectar a una réplica
+    'reintento_replica': 30,     # segundos que una réplica caída queda fuera de la rotación
+    'ventana_consistencia': 60,  # segundos tras una carga en que se verifica el GTID
+    'espera_gtid': 0.5,          # segundos máximos esperando a que la réplica alcance el GTID
+    'archivo_marca': '/tmp/sat_ultima_escritura.json'
+}
 
 # Configuración de importación - ACTUALIZADO
 IMPORT_CONFIG = {
@@ -43,6 +56,91 @@ DB_SETTINGS = {
     'engine': 'InnoDB'
 }
 
+# Configuración del cribado masivo de RFCs (carga_masiva)
+CRIBADO_CONFIG = {
+    'tasa_falsos_positivos': 0.001,
+    'tam_lote': 1000,
+    'carpeta_reportes': 'uploads/reportes'
+}
+
+# Modo de almacenamiento:
+#   'tablas'      → cinco tablas independientes (comportamiento original)
+#   'normalizado' → una sola tabla Contribuyentes con vistas de compatibilidad
+ALMACENAMIENTO_CONFIG = {
+    'modo': 'tablas'
+}
+
+# Configuración del cribado masivo de nombres por similitud
+SIMILITUD_CONFIG = {
+    'umbral': 0.8,
+    'max_resultados': 3,
+    'frecuencia_max_trigrama': 0.1
+}
+
+# Servidor gunicorn (gunicorn.conf.py): workers con hilos. La capacidad
+# total es workers * threads peticiones simultáneas.
+SERVIDOR_CONFIG = {
+    'bind': '0.0.0.0:8091',
+    'workers': int(os.environ.get('GUNICORN_WORKERS', 4)),
+    'threads': int(os.environ.get('GUNICORN_THREADS', 8))
+}
+
+# Control de admisión: concurrencia y cola de espera por clase de endpoint.
+# La carpeta debe ser local y compartida por todos los workers de gunicorn.
+# Una petición en cola también ocupa un hilo, así que la suma de concurrencia
+# + cola de todas las clases no debe superar workers * threads (4 * 8 = 32);
+# las clases pesadas y el autocompletado se dejan muy por debajo para que no
+# acaparen los hilos de las consultas por RFC.
+ADMISION_CONFIG = {
+    'carpeta': '/tmp/sat_admision',
+    'espera_maxima': 10,
+    'intervalo_sondeo': 0.05,
+    'retry_after': 5,
+    'clases': {
+        'consulta': {'concurrencia': 10, 'cola': 4},
+        'sugerencias': {'concurrencia': 3, 'cola': 1},  # una petición por tecla
+        'busqueda': {'concurrencia': 3, 'cola': 3},
+        'exportacion': {'concurrencia': 2, 'cola': 2},
+        'carga': {'concurrencia': 1, 'cola': 1}
+    }
+}
+
+# Autocompletado de RFCs y nombres (/api/sugerencias)
+SUGERENCIAS_CONFIG = {
+    'max_resultados': 10,
+    'intervalo_verificacion': 5  # segundos entre comprobaciones de cargas nuevas
+}
+
+# Perfilado bajo demanda (cProfile + tracemalloc). Desactivado si no hay
+# token: sin él no se instala ningún hook, aunque haya muestreo, porque los
+# perfiles muestreados solo se pueden descargar con el token.
+PERFILADO_CONFIG = {
+    'token': os.environ.get('PERFILADO_TOKEN'),
+    'encabezado': 'X-Perfilar',
+    'muestreo': 0.0,            # fracción de peticiones perfiladas (0.01 = 1%)
+    'carpeta': 'uploads/perfiles',
+    'max_perfiles': 50,
+    'top_funciones': 40,
+    'top_asignaciones': 25,
+    'profundidad_traza': 1
+}
 
+# Exportaciones pre-generadas en cada carga (/exportar/<tabla>)
+EXPORTACION_CONFIG = {
+    'carpeta': 'uploads/exportaciones',
+    'versiones_conservadas': 2,
+    'nivel_gzip': 6
+}
 
+# Ingesta de CSV por lotes de filas (carga_csv y subidas por partes)
+CARGA_CONFIG = {
+    'filas_por_lote': 10000
+}
 
+# Subidas por partes reanudables (/api/subidas). Cada parte debe ser menor
+# que MAX_CONTENT_LENGTH de la aplicación.
+SUBIDAS_CONFIG = {
+    'carpeta': 'uploads/partes',
+    'tam_parte': 8 * 1024 * 1024,
+    'horas_expiracion': 24
+}
@@ -0,0 +1,161 @@
+"""
+Cribado de RFCs en archivos grandes con memoria acotada.
+
+El archivo se lee línea por línea desde disco y cada RFC se prueba contra un
+filtro de Bloom construido con todos los RFCs de las listas. Solo los
+candidatos se confirman contra la base de datos, por lotes.
+"""
+
+import csv
+import hashlib
+import math
+import threading
+
+# ---------------------------------------------------------
+# Filtro de Bloom
+# ---------------------------------------------------------
+
+class FiltroBloom:
+    """Filtro de Bloom sobre un bytearray con doble hashing."""
+
+    def __init__(self, elementos_esperados, tasa_falsos_positivos=0.001):
+        n = max(int(elementos_esperados), 1)
+        bits = int(-n * math.log(tasa_falsos_positivos) / (math.log(2) ** 2))
+        self.num_bits = max(bits, 8)
+        self.num_hashes = max(int(round(self.num_bits / n * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _posiciones(self, valor):
+        digest = hashlib.blake2b(valor.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def agregar(self, valor):
+        for pos in self._posiciones(valor):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, valor):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._posiciones(valor))
+
+
+# ---------------------------------------------------------
+# Construcción del filtro desde la base de datos
+# ---------------------------------------------------------
+
+_filtro_cache = {'version': None, 'filtro': None}
+_filtro_lock = threading.Lock()
+
+
+def version_datos(cursor):
+    """Firma barata del estado de las cargas, para invalidar el filtro."""
+    cursor.execute("SELECT COUNT(*), MAX(fecha) FROM Historial_Cargas")
+    return tuple(cursor.fetchone())
+
+
+def construir_filtro(conn, tablas, tasa_falsos_positivos=0.001, tam_lote=10000):
+    cursor = conn.cursor()
+
+    total = 0
+    for tabla in tablas:
+        cursor.execute(f"SELECT COUNT(*) FROM {tabla} WHERE rfc IS NOT NULL")
+        total += cursor.fetchone()[0]
+
+    filtro = FiltroBloom(total, tasa_falsos_positivos)
+
+    for tabla in tablas:
+        cursor.execute(f"SELECT rfc FROM {tabla} WHERE rfc IS NOT NULL")
+        while True:
+            filas = cursor.fetchmany(tam_lote)
+            if not filas:
+                break
+            for (rfc,) in filas:
+                filtro.agregar(rfc.strip().upper())
+
+    cursor.close()
+    return filtro
+
+
+def obtener_filtro(conn, tablas, tasa_falsos_positivos=0.001):
+    """Devuelve el filtro en caché, reconstruyéndolo si hubo cargas nuevas."""
+    cursor = conn.cursor()
+    version = version_datos(cursor)
+    cursor.close()
+
+    with _filtro_lock:
+        if _filtro_cache['filtro'] is None or _filtro_cache['version'] != version:
+            _filtro_cache['filtro'] = construir_filtro(conn, tablas, tasa_falsos_positivos)
+            _filtro_cache['version'] = version
+        return _filtro_cache['filtro']
+
+
+def invalidar_filtro():
+    with _filtro_lock:
+        _filtro_cache['filtro'] = None
+        _filtro_cache['version'] = None
+
+
+# ---------------------------------------------------------
+# Cribado del archivo
+# ---------------------------------------------------------
+
+def _confirmar(cursor, candidatos, tablas):
+    placeholders = ", ".join(["%s"] * len(candidatos))
+    encontrados = []
+    for tabla in tablas:
+        cursor.execute(
+            f"SELECT DISTINCT rfc, nombre_contribuyente, situacion_contribuyente "
+            f"FROM {tabla} WHERE rfc IN ({placeholders})",
+            list(candidatos)
+        )
+        for rfc, nombre, situacion in cursor.fetchall():
+            encontrados.append((rfc.upper(), nombre, situacion, tabla))
+    return encontrados
+
+
+def cribar_archivo(ruta, ruta_reporte, conn, filtro, tablas, tam_lote=1000, encoding='latin1'):
+    """
+    Lee `ruta` línea por línea y escribe en `ruta_reporte` (CSV) los RFCs
+    encontrados en alguna lista. Devuelve un diccionario con los contadores.
+
+    Un RFC repetido en el archivo se confirma una sola vez: el reporte tiene
+    una fila por cada tabla donde aparece, sin importar cuántas veces venga
+    en el archivo ni el tamaño de lote. `encontrados` cuenta RFCs distintos
+    y `coincidencias` las filas (RFC, tabla) del reporte.
+    """
+    cursor = conn.cursor()
+    resumen = {'procesados': 0, 'candidatos': 0, 'encontrados': 0, 'coincidencias': 0}
+    candidatos = set()
+    # Solo guarda los RFCs que pasaron el filtro, no todo el archivo
+    vistos = set()
+
+    with open(ruta, 'r', encoding=encoding, errors='replace') as entrada, \
+            open(ruta_reporte, 'w', newline='', encoding='utf-8') as salida:
+        writer = csv.writer(salida)
+        writer.writerow(['rfc', 'nombre_contribuyente', 'situacion_contribuyente', 'tabla'])
+
+        def vaciar():
+            filas = _confirmar(cursor, candidatos, tablas)
+            writer.writerows(filas)
+            resumen['coincidencias'] += len(filas)
+            resumen['encontrados'] += len({fila[0] for fila in filas})
+            candidatos.clear()
+
+        for linea in entrada:
+            rfc = linea.strip().upper()
+            if not rfc:
+                continue
+            resumen['procesados'] += 1
+            if rfc in filtro and rfc not in vistos:
+                vistos.add(rfc)
+                resumen['candidatos'] += 1
+                candidatos.add(rfc)
+                if len(candidatos) >= tam_lote:
+                    vaciar()
+
+        if candidatos:
+            vaciar()
+
+    cursor.close()
+    return resumen
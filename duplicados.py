@@ -0,0 +1,108 @@
+"""
+Índice de RFCs duplicados, mantenido en cada carga.
+
+La tabla Conteo_RFC guarda cuántas veces aparece cada RFC en cada tabla.
+Las cargas (carga_csv, init_db.py) suman sus ocurrencias de forma
+incremental, y las estadísticas solo leen las filas con ocurrencias > 1.
+"""
+
+from collections import Counter
+
+DDL_CONTEO_RFC = """
+    CREATE TABLE IF NOT EXISTS Conteo_RFC (
+        rfc VARCHAR(20) NOT NULL,
+        tabla VARCHAR(64) NOT NULL,
+        ocurrencias INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (tabla, rfc),
+        KEY idx_tabla_ocurrencias (tabla, ocurrencias)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+
+def asegurar_tabla(cursor):
+    cursor.execute(DDL_CONTEO_RFC)
+
+
+def registrar_rfcs(cursor, tabla, rfcs):
+    """Suma al índice las ocurrencias de los RFCs recién insertados en `tabla`."""
+    conteo = Counter(str(r).strip().upper() for r in rfcs if r is not None and str(r).strip())
+    if not conteo:
+        return 0
+
+    cursor.executemany("""
+        INSERT INTO Conteo_RFC (rfc, tabla, ocurrencias)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE ocurrencias = ocurrencias + VALUES(ocurrencias)
+    """, [(rfc, tabla, n) for rfc, n in conteo.items()])
+    return len(conteo)
+
+
+def reconstruir(cursor, tabla):
+    """Recalcula desde cero el conteo de una tabla (datos previos al índice)."""
+    cursor.execute("DELETE FROM Conteo_RFC WHERE tabla = %s", (tabla,))
+    cursor.execute(f"""
+        INSERT INTO Conteo_RFC (rfc, tabla, ocurrencias)
+        SELECT UPPER(TRIM(rfc)), %s, COUNT(*)
+        FROM {tabla}
+        WHERE rfc IS NOT NULL AND TRIM(rfc) <> ''
+        GROUP BY UPPER(TRIM(rfc))
+    """, (tabla,))
+
+
+def sin_indice(cursor, tablas):
+    """
+    Tablas que tienen datos pero ninguna fila en Conteo_RFC: se cargaron
+    antes de que existiera el índice y hay que reconstruirlas.
+    """
+    placeholders = ", ".join(["%s"] * len(tablas))
+    cursor.execute(f"""
+        SELECT TABLE_NAME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE()
+          AND TABLE_TYPE = 'BASE TABLE'
+          AND TABLE_NAME IN ({placeholders})
+    """, list(tablas))
+    existentes = {fila[0] for fila in cursor.fetchall()}
+
+    pendientes = []
+    for tabla in tablas:
+        if tabla not in existentes:
+            continue
+        cursor.execute(f"SELECT EXISTS(SELECT 1 FROM {tabla} WHERE rfc IS NOT NULL)")
+        con_datos = cursor.fetchone()[0]
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM Conteo_RFC WHERE tabla = %s)", (tabla,))
+        indexada = cursor.fetchone()[0]
+        if con_datos and not indexada:
+            pendientes.append(tabla)
+    return pendientes
+
+
+def contar_duplicados(conn, tablas):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT tabla, COUNT(*) AS duplicate_count
+        FROM Conteo_RFC
+        WHERE ocurrencias > 1
+        GROUP BY tabla
+    """)
+    conteos = dict(cursor.fetchall())
+    cursor.close()
+    return {tabla: conteos.get(tabla, 0) for tabla in tablas}
+
+
+def listar_duplicados(conn, tabla, limite, offset):
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT rfc, ocurrencias
+        FROM Conteo_RFC
+        WHERE tabla = %s AND ocurrencias > 1
+        ORDER BY ocurrencias DESC, rfc
+        LIMIT %s OFFSET %s
+    """, (tabla, limite, offset))
+    duplicados = [{'rfc': rfc, 'ocurrencias': n} for rfc, n in cursor.fetchall()]
+
+    cursor.execute("""
+        SELECT COUNT(*) FROM Conteo_RFC WHERE tabla = %s AND ocurrencias > 1
+    """, (tabla,))
+    total = cursor.fetchone()[0]
+    cursor.close()
+    return duplicados, total
@@ -0,0 +1,130 @@
+"""
+Artefactos de exportación pre-generados.
+
+Las cargas (carga_csv, init_db.py) escriben para cada tabla un CSV y su
+versión comprimida (.csv.gz) en la carpeta de exportaciones, con nombre
+versionado. Los archivos se escriben en temporales y se publican con
+os.replace; el archivo <tabla>.actual apunta a la versión vigente. La ruta
+/exportar los sirve como archivos estáticos (sendfile, Range, ETag) y, si no
+hay puntero (primera vez, o la última generación falló), genera la
+exportación en ese momento.
+"""
+
+import csv
+import gzip
+import json
+import os
+import shutil
+import time
+
+FORMATOS = ('csv', 'csv.gz')
+
+
+def _ruta_puntero(carpeta, tabla):
+    return os.path.join(carpeta, f"{tabla}.actual")
+
+
+def _reemplazo_atomico(ruta, escribir):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    try:
+        escribir(temporal)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def generar(conn, tabla, carpeta, versiones_conservadas=2, nivel_gzip=6, tam_lote=5000):
+    """Genera la exportación de `tabla` leyendo por lotes y publica la nueva versión."""
+    os.makedirs(carpeta, exist_ok=True)
+    # Nanosegundos: dos cargas en el mismo segundo no empatan al ordenar versiones
+    version = f"{time.time_ns()}_{os.getpid()}"
+    ruta_csv = os.path.join(carpeta, f"{tabla}_{version}.csv")
+
+    def escribir_csv(destino):
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT * FROM {tabla} ORDER BY numero")
+        with open(destino, 'w', newline='', encoding='utf-8') as salida:
+            writer = csv.writer(salida)
+            writer.writerow(cursor.column_names)
+            while True:
+                filas = cursor.fetchmany(tam_lote)
+                if not filas:
+                    break
+                writer.writerows(filas)
+        cursor.close()
+
+    def escribir_gzip(destino):
+        with open(ruta_csv, 'rb') as origen, gzip.open(destino, 'wb', compresslevel=nivel_gzip) as salida:
+            shutil.copyfileobj(origen, salida)
+
+    _reemplazo_atomico(ruta_csv, escribir_csv)
+    _reemplazo_atomico(f"{ruta_csv}.gz", escribir_gzip)
+
+    def escribir_puntero(destino):
+        with open(destino, 'w') as f:
+            json.dump({'version': version, 'fecha': time.strftime('%Y%m%d')}, f)
+
+    _reemplazo_atomico(_ruta_puntero(carpeta, tabla), escribir_puntero)
+
+    limpiar(carpeta, tabla, versiones_conservadas)
+    return version
+
+
+def _orden_version(version):
+    marca = version.split('_', 1)[0]
+    return int(marca) if marca.isdigit() else 0
+
+
+def retirar(carpeta, tabla):
+    """
+    Elimina el puntero de `tabla` para que la siguiente descarga regenere la
+    exportación en lugar de servir una versión anterior a la última carga.
+    """
+    try:
+        os.remove(_ruta_puntero(carpeta, tabla))
+    except FileNotFoundError:
+        pass
+
+
+def limpiar(carpeta, tabla, versiones_conservadas=2):
+    """
+    Elimina versiones antiguas; las descargas en curso conservan su descriptor
+    abierto. La versión a la que apunta el puntero nunca se elimina, aunque
+    otro worker haya publicado una más reciente en medio.
+    """
+    prefijo = f"{tabla}_"
+    versiones = sorted({
+        nombre[len(prefijo):].split('.', 1)[0]
+        for nombre in os.listdir(carpeta)
+        if nombre.startswith(prefijo) and nombre.endswith(('.csv', '.csv.gz'))
+    }, key=_orden_version)
+
+    try:
+        with open(_ruta_puntero(carpeta, tabla)) as f:
+            vigente = json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        vigente = None
+
+    for version in versiones[:max(len(versiones) - versiones_conservadas, 0)]:
+        if version == vigente:
+            continue
+        for formato in FORMATOS:
+            try:
+                os.remove(os.path.join(carpeta, f"{tabla}_{version}.{formato}"))
+            except FileNotFoundError:
+                pass
+
+
+def artefacto(carpeta, tabla, formato='csv'):
+    """Devuelve (ruta, fecha) de la versión vigente, o None si no existe."""
+    try:
+        with open(_ruta_puntero(carpeta, tabla)) as f:
+            puntero = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    ruta = os.path.join(carpeta, f"{tabla}_{puntero['version']}.{formato}")
+    if not os.path.exists(ruta):
+        return None
+    return ruta, puntero['fecha']
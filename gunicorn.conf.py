@@ -0,0 +1,14 @@
+"""
+Configuración de gunicorn: workers con hilos (gthread).
+
+El número de workers y threads sale de SERVIDOR_CONFIG (variables
+GUNICORN_WORKERS y GUNICORN_THREADS); los límites de ADMISION_CONFIG están
+dimensionados contra workers * threads.
+"""
+
+from config import SERVIDOR_CONFIG
+
+bind = SERVIDOR_CONFIG['bind']
+worker_class = 'gthread'
+workers = SERVIDOR_CONFIG['workers']
+threads = SERVIDOR_CONFIG['threads']
@@ -0,0 +1,105 @@
+"""
+Historial de situación por RFC entre publicaciones del SAT.
+
+Cada carga registra en Historial_Situacion únicamente los RFCs cuya
+situación cambió respecto al último estado conocido, etiquetados con la
+fecha de publicación (IMPORT_CONFIG['fechas_actualizacion']). La línea de
+tiempo de un RFC se reconstruye leyendo sus deltas por índice.
+"""
+
+DDL_HISTORIAL_SITUACION = """
+    CREATE TABLE IF NOT EXISTS Historial_Situacion (
+        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        rfc VARCHAR(20) NOT NULL,
+        situacion_anterior VARCHAR(50) NULL,
+        situacion_nueva VARCHAR(50) NULL,
+        fecha_publicacion DATE NULL,
+        origen VARCHAR(64) NULL,
+        fecha_carga DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        KEY idx_rfc (rfc, id)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+SQL_ULTIMO_ESTADO = """
+    SELECT h.rfc, h.situacion_nueva
+    FROM Historial_Situacion h
+    JOIN (
+        SELECT rfc, MAX(id) AS id
+        FROM Historial_Situacion
+        {filtro}
+        GROUP BY rfc
+    ) ultimo ON ultimo.id = h.id
+"""
+
+
+def asegurar_tabla(cursor):
+    cursor.execute(DDL_HISTORIAL_SITUACION)
+
+
+def _ultimo_estado(cursor, rfcs=None):
+    if rfcs is None:
+        cursor.execute(SQL_ULTIMO_ESTADO.format(filtro=""))
+    else:
+        placeholders = ", ".join(["%s"] * len(rfcs))
+        cursor.execute(SQL_ULTIMO_ESTADO.format(filtro=f"WHERE rfc IN ({placeholders})"), list(rfcs))
+    return {rfc.upper(): situacion for rfc, situacion in cursor.fetchall()}
+
+
+def registrar_cambios(conn, situaciones, fecha_publicacion, origen, completo=False, tam_lote=1000):
+    """
+    `situaciones` es un diccionario RFC → situación con el contenido de la
+    carga. Con `completo=True` (listado completo) los RFCs que ya no aparecen
+    se registran con situación nula. No hace commit: va en la transacción
+    de la carga. Devuelve el número de deltas escritos.
+    """
+    cursor = conn.cursor()
+    situaciones = {str(rfc).strip().upper(): s for rfc, s in situaciones.items() if rfc}
+    deltas = []
+
+    if completo:
+        actuales = _ultimo_estado(cursor)
+        for rfc, anterior in actuales.items():
+            nueva = situaciones.get(rfc)
+            if anterior != nueva:
+                deltas.append((rfc, anterior, nueva, fecha_publicacion, origen))
+        for rfc, nueva in situaciones.items():
+            if rfc not in actuales:
+                deltas.append((rfc, None, nueva, fecha_publicacion, origen))
+    else:
+        rfcs = list(situaciones)
+        for i in range(0, len(rfcs), tam_lote):
+            lote = rfcs[i:i + tam_lote]
+            actuales = _ultimo_estado(cursor, lote)
+            for rfc in lote:
+                anterior = actuales.get(rfc)
+                if anterior != situaciones[rfc]:
+                    deltas.append((rfc, anterior, situaciones[rfc], fecha_publicacion, origen))
+
+    if deltas:
+        cursor.executemany("""
+            INSERT INTO Historial_Situacion
+                (rfc, situacion_anterior, situacion_nueva, fecha_publicacion, origen)
+            VALUES (%s, %s, %s, %s, %s)
+        """, deltas)
+
+    cursor.close()
+    return len(deltas)
+
+
+def obtener_historial(conn, rfc):
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("""
+        SELECT situacion_anterior, situacion_nueva AS situacion,
+               fecha_publicacion, origen, fecha_carga
+        FROM Historial_Situacion
+        WHERE rfc = %s
+        ORDER BY id
+    """, (rfc.strip().upper(),))
+    historial = cursor.fetchall()
+    cursor.close()
+
+    for evento in historial:
+        for campo in ('fecha_publicacion', 'fecha_carga'):
+            if evento[campo] is not None:
+                evento[campo] = evento[campo].isoformat()
+    return historial
@@ -11,9 +11,15 @@ Además llena la tabla Listado_Completo_69_B
 
 import pandas as pd
 import mysql.connector
+import sys
 import traceback
 from datetime import datetime
-from config import DB_CONFIG
+from config import IMPORT_CONFIG, EXPORTACION_CONFIG
+from conexiones import conectar_primario, marcar_escritura
+import duplicados
+import almacen
+import historial
+import exportaciones
 
 # ---------------------------------------------------------
 # Mapeo de columnas del CSV → columnas de la base de datos
@@ -52,8 +58,9 @@ COLUMN_MAP = {
 # ---------------------------------------------------------
 
 def conectar_db():
+    """Todas las escrituras de la inicialización van al primario."""
     try:
-        return mysql.connector.connect(**DB_CONFIG)
+        return conectar_primario()
     except Exception as e:
         print("❌ Error conectando a la base de datos:", e)
         exit(1)
@@ -73,7 +80,31 @@ def parse_fecha(valor):
 # ---------------------------------------------------------
 # Inserción en tabla
 # ---------------------------------------------------------
-def insertar_en_tabla(tabla, registros):
+
+ARCHIVO_CSV = "data/Listado_Completo_69-B.csv"
+
+def registrar_carga(cursor, tabla, total):
+    # Historial_Cargas también es la versión de los datos que usan los
+    # índices en memoria de la aplicación (cribado, similitud, sugerencias)
+    cursor.execute("""
+        INSERT INTO Historial_Cargas (nombre_archivo, tabla, registros)
+        VALUES (%s, %s, %s)
+    """, (ARCHIVO_CSV.split("/")[-1], tabla, total))
+
+def registrar_historial(conn, registros):
+    """
+    Registra solo los RFCs cuya situación cambió desde la publicación
+    anterior. Sin commit: va en la transacción que inserta el listado.
+    """
+    return historial.registrar_cambios(
+        conn,
+        {r["rfc"]: r.get("situacion_contribuyente") for r in registros},
+        IMPORT_CONFIG["fechas_actualizacion"]["Listado_Completo_69_B"],
+        "init_db",
+        completo=True
+    )
+
+def insertar_en_tabla(tabla, registros, con_historial=False):
     if not registros:
         return 0
 
@@ -102,17 +133,104 @@ def insertar_en_tabla(tabla, registros):
     valores = [tuple(r.values()) for r in registros_filtrados]
 
     cursor.executemany(query, valores)
-    conn.commit()
-
     total = cursor.rowcount
 
+    # Mantener el índice de duplicados en la misma transacción
+    duplicados.registrar_rfcs(cursor, tabla, [r.get("rfc") for r in registros_filtrados])
+    cambios = registrar_historial(conn, registros) if con_historial else None
+    registrar_carga(cursor, tabla, total)
+    conn.commit()
+
     cursor.close()
     conn.close()
 
     print(f"✅ Insertados {total} registros en {tabla}")
+    if cambios is not None:
+        print(f"✅ Registrados {cambios} cambios de situación en el historial")
     return total
 
 
+def insertar_normalizado(registros):
+    """Una sola escritura por fila en Contribuyentes (modo normalizado)."""
+    registros = [r for r in registros if r.get("rfc")]
+    if not registros:
+        return 0
+
+    conn = conectar_db()
+    cursor = conn.cursor()
+
+    almacen.preparar_esquema(cursor)
+
+    columnas, query = almacen.sql_upsert(registros[0].keys())
+    valores = [tuple(str(r["rfc"]).strip().upper() if c == "rfc" else r.get(c) for c in columnas)
+               for r in registros]
+
+    cursor.executemany(query, valores)
+    cambios = registrar_historial(conn, registros)
+    registrar_carga(cursor, almacen.TABLA_CANONICA, len(valores))
+    conn.commit()
+
+    cursor.close()
+    conn.close()
+
+    print(f"✅ Insertados {len(valores)} registros en {almacen.TABLA_CANONICA}")
+    print(f"✅ Registrados {cambios} cambios de situación en el historial")
+    return len(valores)
+
+
+
+# ---------------------------------------------------------
+# Tablas auxiliares: índice de duplicados e historial
+# ---------------------------------------------------------
+
+TABLAS = ["Definitivos", "Desvirtuados", "Presuntos", "SentenciasFavorables", "Listado_Completo_69_B"]
+
+def preparar_tablas_auxiliares(reconstruir=False):
+    conn = conectar_db()
+    cursor = conn.cursor()
+
+    duplicados.asegurar_tabla(cursor)
+    historial.asegurar_tabla(cursor)
+
+    # En modo normalizado el RFC es llave primaria: no hay índice de duplicados.
+    # Si no, las tablas con datos de antes del índice se reconstruyen solas
+    if almacen.MODO_NORMALIZADO:
+        pendientes = []
+    elif reconstruir:
+        pendientes = TABLAS
+    else:
+        pendientes = duplicados.sin_indice(cursor, TABLAS)
+
+    for tabla in pendientes:
+        duplicados.reconstruir(cursor, tabla)
+        print(f"✅ Índice de duplicados reconstruido para {tabla}")
+
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def finalizar():
+    conn = conectar_db()
+
+    # Exportaciones pre-generadas para /exportar/<tabla>
+    for tabla in TABLAS:
+        try:
+            exportaciones.generar(conn, tabla, EXPORTACION_CONFIG["carpeta"],
+                                  EXPORTACION_CONFIG["versiones_conservadas"],
+                                  EXPORTACION_CONFIG["nivel_gzip"])
+            print(f"✅ Exportación generada para {tabla}")
+        except Exception as e:
+            # Sin puntero, /exportar la genera al pedirla en lugar de servir una versión anterior
+            exportaciones.retirar(EXPORTACION_CONFIG["carpeta"], tabla)
+            print(f"❌ Error generando exportación de {tabla}: {e}")
+
+    # Las lecturas por réplica esperan a que esta carga se haya replicado
+    marcar_escritura(conn)
+    conn.close()
+
+    print("\n✅ PROCESO COMPLETADO")
+
 
 # ---------------------------------------------------------
 # Proceso principal
@@ -122,9 +240,16 @@ def main():
     print("\n🚀 INICIALIZACIÓN DE BASE DE DATOS SAT")
     print("--------------------------------------")
 
+    # Con --reconstruir-duplicados solo se recalcula el índice desde las tablas
+    if "--reconstruir-duplicados" in sys.argv:
+        preparar_tablas_auxiliares(reconstruir=True)
+        return
+
+    preparar_tablas_auxiliares()
+
     # Cargar CSV principal
     df = pd.read_csv(
-        "data/Listado_Completo_69-B.csv",
+        ARCHIVO_CSV,
         encoding="latin1",
         skiprows=2,
         on_bad_lines="skip"
@@ -147,8 +272,17 @@ def main():
     # Convertir a diccionarios
     registros = df.to_dict(orient="records")
 
+    # El historial de situación se escribe en la misma transacción que el
+    # listado completo: si la inserción falla, no quedan deltas huérfanos
+
+    # Modo normalizado: las tablas por situación son vistas sobre Contribuyentes
+    if almacen.MODO_NORMALIZADO:
+        insertar_normalizado(registros)
+        finalizar()
+        return
+
     # Insertar en tabla completa
-    insertar_en_tabla("Listado_Completo_69_B", registros)
+    insertar_en_tabla("Listado_Completo_69_B", registros, con_historial=True)
 
     # Separar por tipo
     tipos = {
@@ -162,7 +296,8 @@ def main():
         subset = [r for r in registros if r.get("situacion_contribuyente") == tipo]
         insertar_en_tabla(tabla, subset)
 
-    print("\n✅ PROCESO COMPLETADO")
+    finalizar()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,172 @@
+"""
+Perfilado bajo demanda de peticiones (cProfile + tracemalloc).
+
+Se activa por petición con el encabezado autorizado (PERFILADO_CONFIG
+['encabezado'] = token) o por muestreo de un porcentaje de peticiones. Cada
+perfil se guarda como <id>.prof (pstats, abrible con snakeviz/pstats) y
+<id>.txt (resumen de funciones y asignaciones) en un anillo acotado en
+disco. El resumen incluye el pico de memoria de la petición; las rutas que
+procesan datos por lotes llaman a marcar_pico() para que las asignaciones
+listadas sean las del momento de mayor uso y no solo las que sobreviven al
+final de la petición. Sin token no se instala ningún hook: el muestreo necesita el token
+para que alguien pueda descargar los perfiles.
+"""
+
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+from flask import abort, g, jsonify, request, send_from_directory
+
+_lock = threading.Lock()
+
+
+def _autorizado(config):
+    token = config.get('token')
+    recibido = request.headers.get(config['encabezado'], '')
+    # Comparación en tiempo constante: no revela cuántos caracteres coinciden
+    return bool(token) and hmac.compare_digest(recibido.encode(), token.encode())
+
+
+def _podar(carpeta, maximo):
+    perfiles = sorted(f for f in os.listdir(carpeta) if f.endswith('.prof'))
+    for nombre in perfiles[:max(len(perfiles) - maximo, 0)]:
+        for ext in ('.prof', '.txt'):
+            try:
+                os.remove(os.path.join(carpeta, nombre[:-5] + ext))
+            except FileNotFoundError:
+                pass  # otro worker ya lo eliminó
+
+
+def marcar_pico():
+    """
+    Si la petición se está perfilando y la memoria trazada supera el máximo
+    visto, guarda una instantánea: el resumen lista las asignaciones de ese
+    momento. Sin perfil activo no hace nada.
+    """
+    if 'perfil' not in g:
+        return
+    actual, _ = tracemalloc.get_traced_memory()
+    if actual > g.get('perfil_pico', 0):
+        g.perfil_pico = actual
+        g.perfil_instantanea = tracemalloc.take_snapshot()
+
+
+def _guardar(config, perfil, instantanea, duracion, memoria, en_pico):
+    carpeta = config['carpeta']
+    endpoint = re.sub(r'[^A-Za-z0-9_]+', '_', request.endpoint or 'desconocido')
+    # Fecha legible más nanosegundos: dos perfiles del mismo endpoint en el
+    # mismo segundo no se pisan, y el orden por nombre sigue siendo cronológico
+    ns = time.time_ns()
+    identificador = (f"{time.strftime('%Y%m%d%H%M%S', time.localtime(ns // 10**9))}_{ns % 10**9:09d}"
+                     f"_{os.getpid()}_{endpoint}")
+
+    perfil.dump_stats(os.path.join(carpeta, f"{identificador}.prof"))
+
+    resumen = io.StringIO()
+    resumen.write(f"{request.method} {request.full_path}\n")
+    resumen.write(f"Duración: {duracion:.3f} s\n")
+    resumen.write(f"Memoria trazada: {memoria[0] / 1048576:.1f} MiB al final, "
+                  f"{memoria[1] / 1048576:.1f} MiB de pico\n\n")
+    pstats.Stats(perfil, stream=resumen).sort_stats('cumulative').print_stats(config['top_funciones'])
+
+    if en_pico:
+        resumen.write("\nAsignaciones de memoria en el pico (tracemalloc):\n")
+    else:
+        resumen.write("\nAsignaciones de memoria al final de la petición (tracemalloc):\n")
+    for estadistica in instantanea.statistics('lineno')[:config['top_asignaciones']]:
+        resumen.write(f"{estadistica}\n")
+
+    with open(os.path.join(carpeta, f"{identificador}.txt"), 'w', encoding='utf-8') as f:
+        f.write(resumen.getvalue())
+
+    _podar(carpeta, config['max_perfiles'])
+
+
+def instalar(app, config):
+    """Registra los hooks y las rutas de administración si el perfilado está habilitado."""
+    if not config.get('token'):
+        if config.get('muestreo'):
+            print("Advertencia: PERFILADO_CONFIG['muestreo'] requiere un token; el perfilado queda desactivado")
+        return
+
+    os.makedirs(config['carpeta'], exist_ok=True)
+
+    @app.before_request
+    def iniciar_perfil():
+        if request.path.startswith('/admin/perfiles'):
+            return
+        if not (_autorizado(config) or random.random() < config.get('muestreo', 0)):
+            return
+        # tracemalloc es global al proceso: un solo perfil a la vez por worker
+        if not _lock.acquire(blocking=False):
+            return
+
+        tracemalloc.start(config['profundidad_traza'])
+        tracemalloc.reset_peak()
+        g.perfil = cProfile.Profile()
+        g.perfil_inicio = time.perf_counter()
+        g.perfil.enable()
+
+    @app.teardown_request
+    def terminar_perfil(exc):
+        perfil = g.pop('perfil', None)
+        if perfil is None:
+            return
+
+        perfil.disable()
+        duracion = time.perf_counter() - g.pop('perfil_inicio')
+        # Las variables de la vista ya se liberaron: el pico se toma aquí y
+        # las asignaciones, de la instantánea de marcar_pico() si la hay
+        memoria = tracemalloc.get_traced_memory()
+        g.pop('perfil_pico', None)
+        instantanea = g.pop('perfil_instantanea', None)
+        en_pico = instantanea is not None
+        if instantanea is None:
+            instantanea = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        try:
+            _guardar(config, perfil, instantanea, duracion, memoria, en_pico)
+        except OSError as e:
+            print(f"Error guardando perfil: {e}")
+        finally:
+            _lock.release()
+
+    def solo_autorizados(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            if not _autorizado(config):
+                abort(403)
+            return vista(*args, **kwargs)
+        return envoltura
+
+    @app.route('/admin/perfiles')
+    @solo_autorizados
+    def listar_perfiles():
+        perfiles = []
+        for nombre in sorted(os.listdir(config['carpeta']), reverse=True):
+            if nombre.endswith('.prof'):
+                ruta = os.path.join(config['carpeta'], nombre)
+                perfiles.append({
+                    'id': nombre[:-5],
+                    'bytes': os.path.getsize(ruta),
+                    'prof': f"/admin/perfiles/{nombre}",
+                    'resumen': f"/admin/perfiles/{nombre[:-5]}.txt",
+                })
+        return jsonify(perfiles)
+
+    @app.route('/admin/perfiles/<nombre>')
+    @solo_autorizados
+    def descargar_perfil(nombre):
+        if not nombre.endswith(('.prof', '.txt')):
+            abort(404)
+        return send_from_directory(os.path.abspath(config['carpeta']), nombre,
+                                   as_attachment=nombre.endswith('.prof'))
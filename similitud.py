@@ -0,0 +1,176 @@
+"""
+Cribado masivo de nombres por similitud.
+
+Los nombres se normalizan (sin acentos, sin puntuación, sin formas
+societarias como "SA DE CV") y se descomponen en trigramas. Un índice
+invertido trigrama → ids sirve de bloqueo: solo se puntúan los nombres que
+comparten algún trigrama con la consulta, y el coeficiente de Dice se
+calcula para todos ellos a la vez con numpy.
+"""
+
+import csv
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+from cribado import version_datos
+
+# Formas societarias y palabras vacías que no distinguen a un contribuyente
+PALABRAS_IGNORADAS = {
+    'SA', 'DE', 'CV', 'S', 'RL', 'SRL', 'SC', 'SAPI', 'SAB', 'SPR', 'AC', 'A', 'C', 'V',
+    'DEL', 'LA', 'LAS', 'LOS', 'EL', 'Y', 'E',
+    'SOCIEDAD', 'ANONIMA', 'CAPITAL', 'VARIABLE', 'RESPONSABILIDAD', 'LIMITADA',
+    'CIVIL', 'COOPERATIVA', 'PRODUCCION', 'RURAL', 'ASOCIACION',
+}
+
+
+def normalizar(nombre):
+    texto = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode('ascii').upper()
+    texto = re.sub(r'[^A-Z0-9 ]', ' ', texto.replace('.', ''))
+    tokens = texto.split()
+    significativos = [t for t in tokens if t not in PALABRAS_IGNORADAS]
+    return ' '.join(significativos or tokens)
+
+
+def trigramas(texto):
+    texto = f"  {texto} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+# ---------------------------------------------------------
+# Índice de nombres
+# ---------------------------------------------------------
+
+class IndiceNombres:
+
+    def __init__(self, registros, frecuencia_max_trigrama=0.1):
+        """`registros` es un iterable de (rfc, nombre, tabla)."""
+        entradas = {}
+        for rfc, nombre, tabla in registros:
+            if not nombre:
+                continue
+            clave = (str(rfc or '').upper(), nombre)
+            entradas.setdefault(clave, set()).add(tabla)
+
+        self.rfcs = []
+        self.nombres = []
+        self.tablas = []
+        postings = defaultdict(list)
+        grams_por_id = []
+
+        for i, ((rfc, nombre), tablas) in enumerate(entradas.items()):
+            self.rfcs.append(rfc)
+            self.nombres.append(nombre)
+            self.tablas.append(', '.join(sorted(tablas)))
+            grams = trigramas(normalizar(nombre))
+            grams_por_id.append(grams)
+            for g in grams:
+                postings[g].append(i)
+
+        # Los trigramas demasiado frecuentes no discriminan: se excluyen del
+        # índice y de las longitudes para que el Dice sea consistente.
+        limite = max(int(len(self.nombres) * frecuencia_max_trigrama), 50)
+        self.ignorados = {g for g, ids in postings.items() if len(ids) > limite}
+        self.postings = {g: np.asarray(ids, dtype=np.int32)
+                         for g, ids in postings.items() if g not in self.ignorados}
+        self.longitudes = np.asarray(
+            [len(grams - self.ignorados) for grams in grams_por_id], dtype=np.float32
+        )
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def buscar(self, nombre, umbral=0.8, max_resultados=3):
+        grams = trigramas(normalizar(nombre)) - self.ignorados
+        listas = [self.postings[g] for g in grams if g in self.postings]
+        if not listas:
+            return []
+
+        candidatos, compartidos = np.unique(np.concatenate(listas), return_counts=True)
+        puntajes = 2.0 * compartidos / (len(grams) + self.longitudes[candidatos])
+
+        mascara = puntajes >= umbral
+        candidatos, puntajes = candidatos[mascara], puntajes[mascara]
+        if not len(candidatos):
+            return []
+
+        orden = np.argsort(-puntajes)[:max_resultados]
+        return [
+            {
+                'rfc': self.rfcs[i],
+                'nombre_contribuyente': self.nombres[i],
+                'tablas': self.tablas[i],
+                'similitud': round(float(p), 3),
+            }
+            for i, p in zip(candidatos[orden], puntajes[orden])
+        ]
+
+
+_indice_cache = {'version': None, 'indice': None}
+_indice_lock = threading.Lock()
+
+
+def _leer_nombres(conn, tablas, tam_lote=10000):
+    cursor = conn.cursor()
+    for tabla in tablas:
+        cursor.execute(f"SELECT rfc, nombre_contribuyente FROM {tabla} WHERE nombre_contribuyente IS NOT NULL")
+        while True:
+            filas = cursor.fetchmany(tam_lote)
+            if not filas:
+                break
+            for rfc, nombre in filas:
+                yield rfc, nombre, tabla
+    cursor.close()
+
+
+def obtener_indice(conn, tablas, frecuencia_max_trigrama=0.1):
+    """Devuelve el índice en caché, reconstruyéndolo si hubo cargas nuevas."""
+    cursor = conn.cursor()
+    version = version_datos(cursor)
+    cursor.close()
+
+    with _indice_lock:
+        if _indice_cache['indice'] is None or _indice_cache['version'] != version:
+            _indice_cache['indice'] = IndiceNombres(_leer_nombres(conn, tablas), frecuencia_max_trigrama)
+            _indice_cache['version'] = version
+        return _indice_cache['indice']
+
+
+def invalidar_indice():
+    with _indice_lock:
+        _indice_cache['indice'] = None
+        _indice_cache['version'] = None
+
+
+# ---------------------------------------------------------
+# Cribado del archivo
+# ---------------------------------------------------------
+
+def cribar_nombres(ruta, ruta_reporte, indice, umbral=0.8, max_resultados=3, encoding='latin1'):
+    """
+    Lee `ruta` línea por línea (un nombre por línea) y escribe en
+    `ruta_reporte` las mejores coincidencias sobre el umbral.
+    """
+    resumen = {'procesados': 0, 'con_coincidencia': 0}
+
+    with open(ruta, 'r', encoding=encoding, errors='replace') as entrada, \
+            open(ruta_reporte, 'w', newline='', encoding='utf-8') as salida:
+        writer = csv.writer(salida)
+        writer.writerow(['nombre_buscado', 'rfc', 'nombre_contribuyente', 'tablas', 'similitud'])
+
+        for linea in entrada:
+            nombre = linea.strip()
+            if not nombre:
+                continue
+            resumen['procesados'] += 1
+
+            coincidencias = indice.buscar(nombre, umbral, max_resultados)
+            if coincidencias:
+                resumen['con_coincidencia'] += 1
+            for c in coincidencias:
+                writer.writerow([nombre, c['rfc'], c['nombre_contribuyente'], c['tablas'], c['similitud']])
+
+    return resumen
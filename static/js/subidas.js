@@ -0,0 +1,76 @@
+// Subidas por partes reanudables (/api/subidas).
+// Los archivos mayores a una parte se suben en partes con su SHA-256; si la
+// conexión se corta, al volver a enviar el mismo archivo solo se suben las
+// partes que faltan. Los archivos pequeños siguen por el formulario normal.
+//
+//   subidaPorPartes(form, {
+//     tamParte, estado,        // tamaño de parte y elemento donde mostrar el avance
+//     datos: () => ({...}),    // campos extra para iniciar (tipo, tabla, umbral…)
+//     exito: (resultado) => 'mensaje'
+//   });
+
+async function sha256Hex(buffer) {
+  const digest = await crypto.subtle.digest('SHA-256', buffer);
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function subidaPorPartes(form, opciones) {
+  const estado = opciones.estado;
+
+  function mostrar(mensaje, categoria) {
+    estado.className = 'alert alert-' + categoria;
+    estado.textContent = mensaje;
+  }
+
+  form.addEventListener('submit', async (evento) => {
+    const archivo = form.archivo.files[0];
+    if (!archivo || archivo.size <= opciones.tamParte || !window.crypto || !crypto.subtle) return;
+    evento.preventDefault();
+
+    const clave = 'subida:' + form.action + ':' + archivo.name + ':' + archivo.size + ':' + archivo.lastModified;
+
+    try {
+      // Reanudar si ya había una subida de este archivo
+      let subida = null;
+      const idPrevio = localStorage.getItem(clave);
+      if (idPrevio) {
+        const r = await fetch('/api/subidas/' + idPrevio);
+        if (r.ok) subida = await r.json();
+      }
+      if (!subida) {
+        const r = await fetch('/api/subidas', {
+          method: 'POST',
+          headers: {'Content-Type': 'application/json'},
+          body: JSON.stringify(Object.assign({nombre_archivo: archivo.name, tamano: archivo.size}, opciones.datos()))
+        });
+        subida = await r.json();
+        if (!r.ok) throw new Error(subida.error);
+        subida.recibidas = [];
+        localStorage.setItem(clave, subida.id);
+      }
+
+      const recibidas = new Set(subida.recibidas);
+      for (let n = 0; n < subida.total_partes; n++) {
+        if (recibidas.has(n)) continue;
+        const parte = await archivo.slice(n * subida.tam_parte, (n + 1) * subida.tam_parte).arrayBuffer();
+        const r = await fetch('/api/subidas/' + subida.id + '/partes/' + n, {
+          method: 'PUT',
+          headers: {'X-Checksum-SHA256': await sha256Hex(parte)},
+          body: parte
+        });
+        if (!r.ok) throw new Error((await r.json()).error);
+        mostrar('Subiendo parte ' + (n + 1) + ' de ' + subida.total_partes + '…', 'info');
+      }
+
+      mostrar('Procesando archivo…', 'info');
+      const r = await fetch('/api/subidas/' + subida.id + '/finalizar', {method: 'POST'});
+      const resultado = await r.json();
+      if (!r.ok) throw new Error(resultado.error);
+      localStorage.removeItem(clave);
+      mostrar(opciones.exito(resultado), 'success');
+
+    } catch (e) {
+      mostrar('Error en la subida: ' + e.message + ' (vuelve a enviar el archivo para reanudar)', 'danger');
+    }
+  });
+}
@@ -0,0 +1,155 @@
+"""
+Subidas por partes, reanudables.
+
+Protocolo: iniciar (se reserva un id), enviar partes numeradas con su
+SHA-256, y finalizar. Cada parte se escribe directo a disco desde el cuerpo
+de la petición, sin pasar por el parser multipart, y se publica con
+os.replace solo si el checksum coincide. Si la conexión se corta, el
+cliente consulta qué partes ya llegaron y envía solo las que faltan. Al
+finalizar, las partes se concatenan en un único archivo que se entrega como
+ruta a la ingesta o al cribado, según el `destino` registrado al iniciar; las
+partes solo se eliminan cuando el procesamiento termina, así que un fallo al
+finalizar se reintenta sin volver a subir nada.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+
+class ErrorSubida(Exception):
+    pass
+
+
+def _carpeta(base, id_subida):
+    if not id_subida.isalnum():
+        raise ErrorSubida('Identificador de subida no válido')
+    carpeta = os.path.join(base, id_subida)
+    if not os.path.isdir(carpeta):
+        raise ErrorSubida('La subida no existe o ya expiró')
+    return carpeta
+
+
+def _leer_meta(carpeta):
+    with open(os.path.join(carpeta, 'meta.json')) as f:
+        return json.load(f)
+
+
+def _partes_recibidas(carpeta):
+    return sorted(int(nombre[:-5]) for nombre in os.listdir(carpeta) if nombre.endswith('.part'))
+
+
+def purgar_expiradas(base, horas):
+    limite = time.time() - horas * 3600
+    for nombre in os.listdir(base):
+        carpeta = os.path.join(base, nombre)
+        if os.path.isdir(carpeta) and os.path.getmtime(carpeta) < limite:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+
+def iniciar(base, nombre_archivo, tamano, tam_parte, destino, sha256=None):
+    os.makedirs(base, exist_ok=True)
+    id_subida = uuid.uuid4().hex
+    carpeta = os.path.join(base, id_subida)
+    os.makedirs(carpeta)
+
+    meta = {
+        'id': id_subida,
+        'nombre_archivo': nombre_archivo,
+        'tamano': int(tamano),
+        'tam_parte': tam_parte,
+        'total_partes': max((int(tamano) + tam_parte - 1) // tam_parte, 1),
+        'sha256': sha256,
+        'destino': destino,
+    }
+    with open(os.path.join(carpeta, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def estado(base, id_subida):
+    carpeta = _carpeta(base, id_subida)
+    meta = _leer_meta(carpeta)
+    meta['recibidas'] = _partes_recibidas(carpeta)
+    return meta
+
+
+def guardar_parte(base, id_subida, numero, flujo, checksum, tam_bloque=64 * 1024):
+    """Escribe la parte `numero` leyendo `flujo` por bloques y verificando su SHA-256."""
+    carpeta = _carpeta(base, id_subida)
+    meta = _leer_meta(carpeta)
+
+    if not 0 <= numero < meta['total_partes']:
+        raise ErrorSubida('Número de parte fuera de rango')
+    if not checksum:
+        raise ErrorSubida('Falta el checksum de la parte')
+
+    destino = os.path.join(carpeta, f"{numero}.part")
+    temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    escritos = 0
+
+    try:
+        with open(temporal, 'wb') as salida:
+            while True:
+                bloque = flujo.read(tam_bloque)
+                if not bloque:
+                    break
+                escritos += len(bloque)
+                if escritos > meta['tam_parte']:
+                    raise ErrorSubida('La parte excede el tamaño acordado')
+                digest.update(bloque)
+                salida.write(bloque)
+
+        if digest.hexdigest() != checksum.lower():
+            raise ErrorSubida('El checksum de la parte no coincide')
+
+        os.replace(temporal, destino)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+    os.utime(carpeta)
+    return escritos
+
+
+def descartar(base, id_subida):
+    """Elimina las partes de una subida ya procesada."""
+    shutil.rmtree(_carpeta(base, id_subida), ignore_errors=True)
+
+
+def ensamblar(base, id_subida, carpeta_destino):
+    """
+    Concatena las partes en un archivo temporal de `carpeta_destino` y
+    devuelve (ruta, meta). El archivo se copia por bloques: nunca se carga
+    completo en memoria. Las partes se conservan; tras una ingesta exitosa
+    hay que llamar a descartar().
+    """
+    carpeta = _carpeta(base, id_subida)
+    meta = _leer_meta(carpeta)
+
+    faltantes = sorted(set(range(meta['total_partes'])) - set(_partes_recibidas(carpeta)))
+    if faltantes:
+        raise ErrorSubida(f"Faltan partes: {faltantes[:20]}")
+
+    fd, ruta = tempfile.mkstemp(prefix=f"{id_subida}_", suffix=os.path.splitext(meta['nombre_archivo'])[1],
+                                dir=carpeta_destino)
+    digest = hashlib.sha256()
+
+    with os.fdopen(fd, 'wb') as salida:
+        for numero in range(meta['total_partes']):
+            with open(os.path.join(carpeta, f"{numero}.part"), 'rb') as parte:
+                for bloque in iter(lambda: parte.read(1024 * 1024), b''):
+                    digest.update(bloque)
+                    salida.write(bloque)
+
+    if os.path.getsize(ruta) != meta['tamano'] or (meta['sha256'] and digest.hexdigest() != meta['sha256'].lower()):
+        os.remove(ruta)
+        raise ErrorSubida('El archivo ensamblado no coincide con el tamaño o checksum declarado')
+
+    os.utime(carpeta)
+    return ruta, meta
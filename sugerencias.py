@@ -0,0 +1,219 @@
+"""
+Índice de prefijos para autocompletar RFCs y nombres.
+
+Una lista ordenada de tuplas (clave normalizada, rfc) se consulta con
+bisect: la búsqueda es logarítmica y solo recorre las claves que empiezan
+con el prefijo. Las cargas se incorporan mezclando las claves nuevas con
+las existentes, sin reconstruir el índice completo.
+"""
+
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from cribado import version_datos
+
+
+def normalizar_prefijo(texto):
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').upper()
+    texto = re.sub(r'[^A-Z0-9& ]', ' ', texto.replace('.', ''))
+    return ' '.join(texto.split())
+
+
+class IndicePrefijos:
+
+    def __init__(self):
+        self.contribuyentes = {}
+        self.claves = []
+
+    def agregar(self, registros):
+        """`registros` es un iterable de (rfc, nombre, tabla)."""
+        nuevas = []
+        for rfc, nombre, tabla in registros:
+            if not rfc:
+                continue
+            rfc = str(rfc).strip().upper()
+            contribuyente = self.contribuyentes.get(rfc)
+            if contribuyente is None:
+                contribuyente = {'rfc': rfc, 'nombre_contribuyente': nombre, 'tablas': set()}
+                self.contribuyentes[rfc] = contribuyente
+                nuevas.append((rfc, rfc))
+                if nombre:
+                    nuevas.append((normalizar_prefijo(nombre), rfc))
+            contribuyente['tablas'].add(tabla)
+
+        if nuevas:
+            nuevas.sort()
+            self.claves = list(heapq.merge(self.claves, nuevas))
+        return len(nuevas)
+
+    def buscar(self, prefijo, limite=10):
+        prefijo = normalizar_prefijo(prefijo)
+        if not prefijo:
+            return []
+
+        resultados = []
+        vistos = set()
+        i = bisect_left(self.claves, (prefijo,))
+        while i < len(self.claves) and len(resultados) < limite:
+            clave, rfc = self.claves[i]
+            if not clave.startswith(prefijo):
+                break
+            if rfc not in vistos:
+                vistos.add(rfc)
+                contribuyente = self.contribuyentes[rfc]
+                resultados.append({
+                    'rfc': rfc,
+                    'nombre_contribuyente': contribuyente['nombre_contribuyente'],
+                    'tablas': sorted(contribuyente['tablas']),
+                    'coincide': 'rfc' if clave == rfc else 'nombre',
+                })
+            i += 1
+        return resultados
+
+
+_indice_cache = {'version': None, 'indice': None, 'verificado': 0.0}
+# _indice_lock solo protege el acceso a _indice_cache (operaciones breves);
+# la consulta de versión y la reconstrucción se serializan con otro lock para
+# que las búsquedas no esperen detrás de ellas
+_indice_lock = threading.Lock()
+_reconstruccion_lock = threading.Lock()
+
+
+def leer_registros(conn, tablas, tam_lote=10000):
+    cursor = conn.cursor()
+    for tabla in tablas:
+        cursor.execute(f"SELECT rfc, nombre_contribuyente FROM {tabla} WHERE rfc IS NOT NULL")
+        while True:
+            filas = cursor.fetchmany(tam_lote)
+            if not filas:
+                break
+            for rfc, nombre in filas:
+                yield rfc, nombre, tabla
+    cursor.close()
+
+
+def _vigente(intervalo_verificacion):
+    """El índice en caché si se verificó hace menos de `intervalo_verificacion` s."""
+    with _indice_lock:
+        if (_indice_cache['indice'] is not None
+                and time.monotonic() - _indice_cache['verificado'] < intervalo_verificacion):
+            return _indice_cache['indice']
+        return None
+
+
+def obtener_indice(conectar, tablas, intervalo_verificacion=5):
+    """
+    Devuelve el índice en caché. La versión de los datos se consulta como
+    mucho cada `intervalo_verificacion` segundos, así que la mayoría de las
+    consultas no tocan la base de datos; `conectar` solo se llama entonces.
+    Si otro worker cargó datos, el índice nuevo se construye fuera del lock
+    y se publica al terminar; mientras tanto, o si la base de datos no
+    responde, se sigue sirviendo el anterior. Solo sin índice previo se
+    espera a la construcción.
+    """
+    indice = _vigente(intervalo_verificacion)
+    if indice is not None:
+        return indice
+
+    with _indice_lock:
+        anterior = _indice_cache['indice']
+
+    # Con un índice que servir no se espera a otro hilo que ya esté verificando
+    if not _reconstruccion_lock.acquire(blocking=anterior is None):
+        return anterior
+
+    try:
+        # Otro hilo pudo terminar la verificación mientras se esperaba el lock
+        indice = _vigente(intervalo_verificacion)
+        if indice is not None:
+            return indice
+
+        try:
+            conn = conectar()
+            try:
+                cursor = conn.cursor()
+                version = version_datos(cursor)
+                cursor.close()
+
+                with _indice_lock:
+                    al_dia = _indice_cache['indice'] is not None and _indice_cache['version'] == version
+
+                nuevo = None
+                if not al_dia:
+                    nuevo = IndicePrefijos()
+                    nuevo.agregar(leer_registros(conn, tablas))
+            finally:
+                conn.close()
+
+        except Exception as e:
+            if anterior is None:
+                raise
+            print(f"Sugerencias: se sirve el índice anterior ({e})")
+            with _indice_lock:
+                _indice_cache['verificado'] = time.monotonic()
+            return anterior
+
+        with _indice_lock:
+            if nuevo is not None:
+                _indice_cache['indice'] = nuevo
+                _indice_cache['version'] = version
+            _indice_cache['verificado'] = time.monotonic()
+            return _indice_cache['indice']
+
+    finally:
+        _reconstruccion_lock.release()
+
+
+def invalidar_indice():
+    with _indice_lock:
+        _indice_cache['indice'] = None
+        _indice_cache['version'] = None
+
+
+def agregar_registros(registros):
+    """Incorpora al índice de este worker las filas recién cargadas (si ya está construido)."""
+    with _indice_lock:
+        if _indice_cache['indice'] is not None:
+            _indice_cache['indice'].agregar(registros)
+
+
+def estado_previo(conn):
+    """
+    Captura, antes de una carga, el índice en caché, su versión y la versión
+    de la base de datos. Se pasa a adoptar_version() tras el commit.
+    """
+    cursor = conn.cursor()
+    version = version_datos(cursor)
+    cursor.close()
+
+    with _indice_lock:
+        return _indice_cache['indice'], _indice_cache['version'], version
+
+
+def adoptar_version(conn, previo):
+    """
+    Tras el commit de una carga, el índice de este worker ya la contiene:
+    adopta la nueva versión para no reconstruirlo en la siguiente consulta.
+    Solo es válido si el índice es el mismo que al empezar, estaba al día y
+    la única carga registrada desde entonces es esta; si otro worker cargó
+    datos en medio, el índice no los tiene y se invalida.
+    """
+    indice_previo, version_cache, version_base = previo
+
+    cursor = conn.cursor()
+    version = version_datos(cursor)
+    cursor.close()
+
+    with _indice_lock:
+        if _indice_cache['indice'] is None:
+            return
+        if (_indice_cache['indice'] is indice_previo and version_cache == version_base
+                and version[0] == version_base[0] + 1):
+            _indice_cache['version'] = version
+        else:
+            _indice_cache['indice'] = None
+            _indice_cache['version'] = None